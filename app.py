@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, g, has_app_context, has_request_context, send_file, abort, stream_with_context
+from werkzeug.security import safe_join
 import sqlite3
 import bcrypt
 import uuid
@@ -6,11 +7,28 @@ import hmac
 import hashlib
 import base64
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import OrderedDict
 import io
 import csv
+import codecs
+import re
+import unicodedata
 from functools import wraps
 import os
+import click
+import threading
+import time
+import queue
+import zipfile
+import gzip
+import mimetypes
+import urllib.request
+import logging
+import atexit
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
@@ -19,43 +37,522 @@ QR_SECRET = os.environ.get('QR_SECRET', 'qr-signing-secret-change-this-too')
 # Database configuration - supports both SQLite (local) and PostgreSQL (production)
 DATABASE_URL = os.environ.get('DATABASE_URL', 'epass.db')
 
+# Optional read replica (same backend as DATABASE_URL) for the heavy read paths:
+# search, export, dashboard counters and offline scanner snapshots
+READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 2))
+
 # Fix for Render PostgreSQL URL
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+if READ_DATABASE_URL and READ_DATABASE_URL.startswith('postgres://'):
+    READ_DATABASE_URL = READ_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
 # Price constants
 PRICE_SINGLE = 499
 PRICE_COUPLE = 999
 
+# Compact QR payloads: prefix + base32(16-byte UUID + 9-byte truncated HMAC), all QR alphanumeric
+QR_COMPACT_PREFIX = 'EP1:'
+QR_COMPACT_SIG_BYTES = 9
+
+# Password hashing: bcrypt cost factor and the executor logins are checked on
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 4))  # keep below the worker's request threads
+
+# /api/scan abuse protection: per-device token bucket, coalescing of repeated
+# payloads, and sampled logging of rejected payloads
+SCAN_RATE = float(os.environ.get('SCAN_RATE', 5))
+SCAN_BURST = int(os.environ.get('SCAN_BURST', 20))
+SCAN_COALESCE_WINDOW = float(os.environ.get('SCAN_COALESCE_WINDOW', 2))
+SCAN_LOG_SAMPLE = int(os.environ.get('SCAN_LOG_SAMPLE', 100))
+QR_PAYLOAD_MAX = 512
+
+# Offline scanner sync and batch scanning
+QR_TAG_LENGTH = 16
+SNAPSHOT_OVERLAP = 100
+SCAN_BATCH_MAX = 5000
+
+# Append-only scan event log: every scan attempt, whatever its outcome. Requests only
+# enqueue; a background thread per worker commits up to SCAN_EVENT_BATCH events at a
+# time, SCAN_EVENT_FLUSH_MS after the first one arrives
+SCAN_EVENT_FLUSH_MS = float(os.environ.get('SCAN_EVENT_FLUSH_MS', 5))
+SCAN_EVENT_BATCH = int(os.environ.get('SCAN_EVENT_BATCH', 500))
+SCAN_EVENT_QUEUE = int(os.environ.get('SCAN_EVENT_QUEUE', 50000))  # beyond this, events are dropped
+
+# Per-worker gate cache of scanned and unknown passes
+PASS_CACHE_SIZE = int(os.environ.get('PASS_CACHE_SIZE', 20000))
+PASS_CACHE_TTL = float(os.environ.get('PASS_CACHE_TTL', 600))
+PASS_CACHE_MISSING_TTL = float(os.environ.get('PASS_CACHE_MISSING_TTL', 30))
+
+# Seconds a dashboard stats snapshot is reused (other workers' writes show up within this)
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 5))
+
+# Live stats stream (Server-Sent Events). Each open stream holds a request thread, so
+# streams get at most a quarter of the worker's threads (none on sync workers: dashboards
+# poll instead) and the rest stay free for /api/scan. gunicorn.conf.py sets WEB_THREADS
+# from --threads.
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+STATS_STREAM_POLL = float(os.environ.get('STATS_STREAM_POLL', 2))
+STATS_STREAM_MAX_AGE = int(os.environ.get('STATS_STREAM_MAX_AGE', 300))
+STATS_STREAM_MAX_CLIENTS = int(os.environ.get('STATS_STREAM_MAX_CLIENTS', WEB_THREADS // 4))
+STATS_STREAM_HEARTBEAT = 15
+
+# Server-side QR / pass card rendering
+QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'qr_cache'))
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 512))
+QR_PNG_SCALE = 8
+RENDER_VERSION = '1'
+
+# Self-hosted static assets: served from /assets/ under content-fingerprinted names with
+# precompressed .br/.gz siblings (`flask build-assets`). Vendored libraries are fetched
+# once with `flask vendor-assets`; until then pages fall back to the pinned CDN URL.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+VENDOR_ASSETS = {
+    'vendor/jsQR-1.4.0.js': 'https://unpkg.com/jsqr@1.4.0/dist/jsQR.js',
+    'vendor/html2canvas-1.4.1.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js'
+}
+ASSET_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # preference order
+COMPRESSIBLE_ASSETS = ('.js', '.css', '.svg', '.html', '.json')
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Precached by the scanner service worker, along with the /scanner page itself
+SCANNER_SHELL_ASSETS = ['css/base.css', 'css/scanner.css', 'js/scanner.js', 'js/qr-worker.js', 'vendor/jsQR-1.4.0.js']
+
+# Prometheus metrics at /metrics. Under gunicorn, workers write samples to files in
+# PROMETHEUS_MULTIPROC_DIR (set by gunicorn.conf.py) and /metrics merges them
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, scrapers send "Authorization: Bearer <token>"
+
+REQUEST_LATENCY = Histogram(
+    'epass_request_duration_seconds', 'Request latency', ['route', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+REQUEST_DB_QUERIES = Histogram(
+    'epass_request_db_queries', 'Database statements per request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 100)
+)
+REQUEST_DB_SECONDS = Histogram(
+    'epass_request_db_seconds', 'Time per request spent in database calls', ['route'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, 1, 5)
+)
+QR_VERIFY_SECONDS = Histogram(
+    'epass_qr_verify_seconds', 'QR payload verification time', ['format'],
+    buckets=(5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3)
+)
+SCAN_OUTCOMES = Counter('epass_scan_outcomes_total', 'Scan results', ['endpoint', 'outcome'])
+DB_CONNECTIONS = Gauge('epass_db_connections', 'Pooled database connections', ['state'], multiprocess_mode='livesum')
+
+# [statements, seconds] spent in the database by the current request, or None outside one
+request_db_time = contextvars.ContextVar('request_db_time', default=None)
+
+# Connection pool configuration
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_MAX_AGE = int(os.environ.get('DB_POOL_MAX_AGE', 1800))
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', 30))
+
 def is_postgres():
     """Check if using PostgreSQL"""
     return DATABASE_URL.startswith('postgresql')
 
-def get_db():
-    """Get database connection - works with SQLite and PostgreSQL"""
-    if is_postgres():
+def timed_db_call(fn, args, kwargs=None, statement=True):
+    """Call fn, adding its time (and one statement) to the current request's database totals"""
+    totals = request_db_time.get()
+    if totals is None:
+        return fn(*args, **(kwargs or {}))
+    start = time.perf_counter()
+    try:
+        return fn(*args, **(kwargs or {}))
+    finally:
+        totals[0] += statement
+        totals[1] += time.perf_counter() - start
+
+class InstrumentedCursor:
+    """Cursor wrapper feeding statement counts and time into the request metrics"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def execute(self, *args, **kwargs):
+        return timed_db_call(self._cursor.execute, args, kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return timed_db_call(self._cursor.executemany, args, kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+class PooledConnection:
+    """Connection handed out by get_db(); close() returns it to its pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, *args):
+        return timed_db_call(self._conn.execute, args)
+
+    def commit(self):
+        return timed_db_call(self._conn.commit, (), statement=False)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+class PostgresPool:
+    """Bounded psycopg2 pool with max-age recycling and idle health checks"""
+
+    def __init__(self, url, maxconn):
+        self.url = url
+        self.maxconn = maxconn
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._born = {}
+        self._last_used = {}
+        self.counters = {'created': 0, 'recycled': 0, 'failed_checks': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
         import psycopg2
         from psycopg2.extras import RealDictCursor
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+        conn = psycopg2.connect(self.url, sslmode='require')
         conn.cursor_factory = RealDictCursor
+        self._born[id(conn)] = time.monotonic()
+        self.counters['created'] += 1
         return conn
-    else:
-        conn = sqlite3.connect(DATABASE_URL)
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _usable(self, conn):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - self._born.get(id(conn), now) > DB_POOL_MAX_AGE:
+            self.counters['recycled'] += 1
+            return False
+        if now - self._last_used.get(id(conn), now) > DB_POOL_PING_AFTER:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.close()
+                conn.rollback()
+            except Exception:
+                self.counters['failed_checks'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            self.counters['waits'] += 1
+            if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+                self.counters['timeouts'] += 1
+                raise RuntimeError('Timed out waiting for a database connection')
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                if self._usable(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+            self._last_used[id(conn)] = time.monotonic()
+            with self._lock:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close idle connections (checked-out ones close when released)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            'backend': 'postgresql',
+            'max': self.maxconn,
+            'open': len(self._born),
+            'idle': idle,
+            'in_use': len(self._born) - idle,
+            **self.counters
+        }
+
+class SQLitePool:
+    """One reused WAL-mode SQLite connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = 0
+        self.counters = {'created': 0, 'recycled': 0, 'overflow': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=DB_POOL_TIMEOUT)
         conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._open += 1
+            self.counters['created'] += 1
+        return conn
+
+    def _close(self, conn):
+        conn.close()
+        with self._lock:
+            self._open -= 1
+
+    def acquire(self):
+        local = self._local
+        if getattr(local, 'in_use', False):
+            # Nested get_db() in the same thread gets its own short-lived connection
+            self.counters['overflow'] += 1
+            return self._connect()
+        conn = getattr(local, 'conn', None)
+        if conn is not None and time.monotonic() - local.born > DB_POOL_MAX_AGE:
+            self.counters['recycled'] += 1
+            self._close(conn)
+            conn = None
+        if conn is None:
+            conn = local.conn = self._connect()
+            local.born = time.monotonic()
+        local.in_use = True
         return conn
 
+    def release(self, conn):
+        local = self._local
+        if conn is not getattr(local, 'conn', None):
+            self._close(conn)
+            return
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            local.conn = None
+            self._close(conn)
+        local.in_use = False
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and not getattr(self._local, 'in_use', False):
+            self._local.conn = None
+            self._close(conn)
+
+    def stats(self):
+        return {'backend': 'sqlite', 'open': self._open, **self.counters}
+
+_pools = {}
+_pools_pid = None
+_orphaned_pools = []
+_pools_lock = threading.Lock()
+
+def get_pool(url=None):
+    """Return this process's pool for url (default DATABASE_URL), rebuilding it after a fork"""
+    global _pools, _pools_pid
+    pid = os.getpid()
+    if _pools_pid != pid:
+        with _pools_lock:
+            if _pools_pid != pid:
+                # Never close inherited connections: they share sockets with the parent
+                _orphaned_pools.extend(_pools.values())
+                _pools = {}
+                _pools_pid = pid
+    url = url or DATABASE_URL
+    pool = _pools.get(url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(url)
+            if pool is None:
+                pool = PostgresPool(url, DB_POOL_MAX) if url.startswith('postgresql') else SQLitePool(url)
+                _pools[url] = pool
+    return pool
+
+def close_pools():
+    """Close this process's pooled connections, e.g. in a master process before it forks workers"""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+# Replica lag in seconds; 0 when caught up (an idle primary leaves the replay timestamp old)
+# or when the server is not a standby at all
+REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag
+'''
+
+def replica_lag(url):
+    """Seconds the replica at url is behind the primary; raises if it cannot serve passes"""
+    pool = get_pool(url)
+    conn = PooledConnection(pool, pool.acquire())
+    try:
+        cursor = conn.cursor()
+        if url.startswith('postgresql'):
+            cursor.execute(REPLICA_LAG_SQL)
+            return float(cursor.fetchone()['lag'])
+        # A SQLite copy has no replication position to compare; just check it is readable
+        cursor.execute('SELECT 1 FROM passes LIMIT 1')
+        return 0.0
+    finally:
+        conn.close()
+
+class ReplicaMonitor:
+    """Whether read-only queries may go to a replica.
+
+    Lag is measured at most every REPLICA_CHECK_INTERVAL seconds per worker;
+    while the replica is unreachable or more than REPLICA_MAX_LAG behind,
+    reads go to the primary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self.counters = {'checks': 0, 'failovers': 0}
+
+    def usable(self, url):
+        state = self._state.get(url)
+        if state is None or time.monotonic() - state['checked'] >= REPLICA_CHECK_INTERVAL:
+            with self._lock:
+                state = self._state.get(url)
+                if state is None or time.monotonic() - state['checked'] >= REPLICA_CHECK_INTERVAL:
+                    state = self._check(url)
+        return state['usable']
+
+    def _check(self, url):
+        self.counters['checks'] += 1
+        try:
+            lag, error = replica_lag(url), None
+        except Exception as e:
+            lag, error = None, str(e)
+        return self._record(url, lag, error)
+
+    def _record(self, url, lag, error):
+        usable = error is None and lag <= REPLICA_MAX_LAG
+        previous = self._state.get(url)
+        if not usable and (previous is None or previous['usable']):
+            self.counters['failovers'] += 1
+            app.logger.warning('Read replica unavailable (%s), reading from the primary', error or f'{lag:.1f}s behind')
+        state = {'checked': time.monotonic(), 'usable': usable, 'lag': lag, 'error': error}
+        self._state[url] = state
+        return state
+
+    def mark_failed(self, url, error):
+        """A connection attempt failed: use the primary until the next check"""
+        with self._lock:
+            self._record(url, None, str(error))
+
+    def stats(self, url):
+        state = self._state.get(url) or {}
+        return {'usable': state.get('usable'), 'lag': state.get('lag'), 'error': state.get('error'), **self.counters}
+
+replica_monitor = ReplicaMonitor()
+
+def read_url():
+    """Database for a read-only query: the replica, unless it is unhealthy or this
+    session wrote within REPLICA_MAX_LAG seconds (so it sees its own writes)"""
+    if not READ_DATABASE_URL:
+        return DATABASE_URL
+    if has_request_context() and time.time() - session.get('last_write', 0) < REPLICA_MAX_LAG:
+        return DATABASE_URL
+    return READ_DATABASE_URL if replica_monitor.usable(READ_DATABASE_URL) else DATABASE_URL
+
+def note_write():
+    """Pin this session's reads to the primary until a healthy replica has the write"""
+    if READ_DATABASE_URL and has_request_context():
+        session['last_write'] = time.time()
+
+def get_db(readonly=False):
+    """Get a pooled database connection - works with SQLite and PostgreSQL.
+
+    readonly=True marks a query that may be served by READ_DATABASE_URL;
+    writes and everything else use the primary.
+    """
+    url = read_url() if readonly else DATABASE_URL
+    pool = get_pool(url)
+    try:
+        raw = pool.acquire()
+    except Exception as e:
+        if url == DATABASE_URL:
+            raise
+        replica_monitor.mark_failed(url, e)
+        pool = get_pool()
+        raw = pool.acquire()
+    conn = PooledConnection(pool, raw)
+    if has_app_context():
+        # Returned to the pool at teardown even if the view raised before close()
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Return any connection a view left checked out"""
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+def db_pool_stats():
+    """Connection pool statistics for /health"""
+    return get_pool().stats()
+
 def sql_param():
     """Return correct SQL parameter placeholder"""
     return '%s' if is_postgres() else '?'
 
-def init_db():
-    """Initialize database with schema and seed admin accounts"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    pg = is_postgres()
-    
-    # Create admins table
+# Schema migrations. Each runs once, in order, in its own transaction, and is
+# recorded in schema_version. The first three are written to be safe on
+# databases created before this table existed (everything IF NOT EXISTS).
+# Run them with `flask migrate` or the gunicorn on_starting hook; importing
+# the app never touches the database.
+
+def migration_initial_schema(cursor, pg):
+    """admins and passes tables"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS admins (
             username TEXT PRIMARY KEY,
@@ -64,8 +561,6 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    # Create passes table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS passes (
             pass_id TEXT PRIMARY KEY,
@@ -84,11 +579,97 @@ def init_db():
             UNIQUE(name1, phone1)
         )
     ''')
+
+def migration_pass_change_log(cursor, pg):
+    """Change log feeding offline scanner snapshot deltas"""
+    if pg:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pass_changes (
+                version BIGSERIAL PRIMARY KEY,
+                pass_id TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'passes_log_change'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE OR REPLACE FUNCTION log_pass_change() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        INSERT INTO pass_changes (pass_id) VALUES (OLD.pass_id);
+                    ELSE
+                        INSERT INTO pass_changes (pass_id) VALUES (NEW.pass_id);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER passes_log_change
+                AFTER INSERT OR UPDATE OR DELETE ON passes
+                FOR EACH ROW EXECUTE PROCEDURE log_pass_change()
+            ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pass_changes (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                pass_id TEXT NOT NULL
+            )
+        ''')
+        for event, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS passes_log_{event.lower()}
+                AFTER {event} ON passes
+                BEGIN
+                    INSERT INTO pass_changes (pass_id) VALUES ({ref}.pass_id);
+                END
+            ''')
+
+def migration_search_indexes(cursor, pg):
+    """Search indexes: folded names and phone prefixes; listing order for keyset pagination"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_created ON passes (created_at DESC, pass_id DESC)')
+    if pg:
+        create_pg_search_indexes(cursor)
+        return
     
-    # Seed admin accounts if not exist
-    password = 'diwaliparty@123'
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_phone1 ON passes (phone1)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_phone2 ON passes (phone2)')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'passes_fts'")
+    if not cursor.fetchone():
+        cursor.execute('''
+            CREATE VIRTUAL TABLE passes_fts USING fts5(
+                pass_id UNINDEXED, name1, name2,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+        cursor.execute('INSERT INTO passes_fts (pass_id, name1, name2) SELECT pass_id, name1, name2 FROM passes')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS passes_fts_insert AFTER INSERT ON passes
+        BEGIN
+            INSERT INTO passes_fts (pass_id, name1, name2) VALUES (NEW.pass_id, NEW.name1, NEW.name2);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS passes_fts_update AFTER UPDATE OF name1, name2 ON passes
+        BEGIN
+            DELETE FROM passes_fts WHERE pass_id = OLD.pass_id;
+            INSERT INTO passes_fts (pass_id, name1, name2) VALUES (NEW.pass_id, NEW.name1, NEW.name2);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS passes_fts_delete AFTER DELETE ON passes
+        BEGIN
+            DELETE FROM passes_fts WHERE pass_id = OLD.pass_id;
+        END
+    ''')
+
+def migration_scan_indexes(cursor, pg):
+    """Scan status filter, gate cache warm-up (latest scans) and the pass type filter"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_scanned ON passes (scanned_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_type ON passes (pass_type, created_at DESC)')
+
+def migration_default_admins(cursor, pg):
+    """Seed the five admin accounts (bcrypt only runs when one is missing)"""
     admin_users = [
         ('admin1', 'Admin One'),
         ('admin2', 'Admin Two'),
@@ -97,8 +678,15 @@ def init_db():
         ('admin5', 'Admin Five')
     ]
     
+    cursor.execute('SELECT username FROM admins')
+    existing = {row['username'] for row in cursor.fetchall()}
+    missing = [(username, display_name) for username, display_name in admin_users if username not in existing]
+    if not missing:
+        return
+    password_hash = hash_password('diwaliparty@123')
+    
     param = sql_param()
-    for username, display_name in admin_users:
+    for username, display_name in missing:
         if pg:
             cursor.execute(
                 f'INSERT INTO admins (username, password_hash, display_name) VALUES ({param}, {param}, {param}) ON CONFLICT (username) DO NOTHING',
@@ -109,9 +697,448 @@ def init_db():
                 f'INSERT OR IGNORE INTO admins (username, password_hash, display_name) VALUES ({param}, {param}, {param})',
                 (username, password_hash, display_name)
             )
+
+def rollup_sql(ref, sign, pg):
+    """Statements adding (sign '') or removing (sign '-') one pass row's contribution to the
+    timing-slot rollups; ref is NEW or OLD inside a trigger"""
+    guests = f"CASE WHEN {ref}.pass_type = 'COUPLE' THEN 2 ELSE 1 END"
+    minute = f"date_trunc('minute', {ref}.scanned_at)" if pg else f"strftime('%Y-%m-%d %H:%M', {ref}.scanned_at)"
+    totals = f'''
+        INSERT INTO slot_totals (timing, passes, guests) VALUES ({ref}.timing, {sign}1, {sign}{guests})
+        ON CONFLICT (timing) DO UPDATE
+        SET passes = slot_totals.passes + excluded.passes, guests = slot_totals.guests + excluded.guests
+    '''
+    arrivals = f'''
+        INSERT INTO slot_arrivals (timing, minute, scans, guests)
+        SELECT {ref}.timing, {minute}, {sign}1, {sign}{guests} WHERE {ref}.scanned_at IS NOT NULL
+        ON CONFLICT (timing, minute) DO UPDATE
+        SET scans = slot_arrivals.scans + excluded.scans, guests = slot_arrivals.guests + excluded.guests
+    '''
+    return totals, arrivals
+
+def migration_timing_rollups(cursor, pg):
+    """Per-timing-slot pass totals and per-minute arrivals, kept current by triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS slot_totals (
+            timing TEXT PRIMARY KEY,
+            passes INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS slot_arrivals (
+            timing TEXT NOT NULL,
+            minute {'TIMESTAMP' if pg else 'TEXT'} NOT NULL,
+            scans INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (timing, minute)
+        )
+    ''')
+    
+    new_totals, new_arrivals = rollup_sql('NEW', '', pg)
+    old_totals, old_arrivals = rollup_sql('OLD', '-', pg)
+    slot_changed = 'OLD.timing IS DISTINCT FROM NEW.timing OR OLD.pass_type IS DISTINCT FROM NEW.pass_type' if pg \
+        else 'OLD.timing IS NOT NEW.timing OR OLD.pass_type IS NOT NEW.pass_type'
+    scan_changed = ('OLD.scanned_at IS DISTINCT FROM NEW.scanned_at' if pg else 'OLD.scanned_at IS NOT NEW.scanned_at') \
+        + f' OR {slot_changed}'
+    
+    if pg:
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'passes_rollup'")
+        if not cursor.fetchone():
+            # A scan only touches its minute bucket; the slot totals row is not locked by scans
+            cursor.execute(f'''
+                CREATE OR REPLACE FUNCTION rollup_pass_change() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'INSERT' THEN
+                        {new_totals};
+                        {new_arrivals};
+                    ELSIF TG_OP = 'DELETE' THEN
+                        {old_totals};
+                        {old_arrivals};
+                    ELSE
+                        IF {slot_changed} THEN
+                            {old_totals};
+                            {new_totals};
+                        END IF;
+                        IF {scan_changed} THEN
+                            {old_arrivals};
+                            {new_arrivals};
+                        END IF;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER passes_rollup
+                AFTER INSERT OR DELETE OR UPDATE OF timing, pass_type, scanned_at ON passes
+                FOR EACH ROW EXECUTE PROCEDURE rollup_pass_change()
+            ''')
+    else:
+        triggers = [
+            ('insert', 'AFTER INSERT', '', [new_totals, new_arrivals]),
+            ('delete', 'AFTER DELETE', '', [old_totals, old_arrivals]),
+            ('slot', 'AFTER UPDATE OF timing, pass_type', f'WHEN {slot_changed}', [old_totals, new_totals]),
+            ('scan', 'AFTER UPDATE OF timing, pass_type, scanned_at', f'WHEN {scan_changed}', [old_arrivals, new_arrivals]),
+        ]
+        for name, event, when, statements in triggers:
+            body = ';'.join(statements)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS passes_rollup_{name}
+                {event} ON passes {when}
+                BEGIN {body}; END
+            ''')
+    # Filled by migration 9, which rebuilds the rollups into the sharded slot_arrivals
+
+def rebuild_rollups(cursor, pg):
+    """Recompute the slot rollups from passes with a single scan of the table"""
+    if pg:
+        # Block concurrent scans until the rebuilt rollups are committed
+        cursor.execute('LOCK TABLE passes IN SHARE MODE')
+    cursor.execute('DELETE FROM slot_totals')
+    cursor.execute('DELETE FROM slot_arrivals')
+    minute = "date_trunc('minute', scanned_at)" if pg else "strftime('%Y-%m-%d %H:%M', scanned_at)"
+    shard = arrival_shard('pass_id', pg)
+    cursor.execute(f'''
+        SELECT timing, {minute} AS minute, {shard} AS shard, COUNT(*) AS passes,
+               SUM(CASE WHEN pass_type = 'COUPLE' THEN 2 ELSE 1 END) AS guests
+        FROM passes
+        GROUP BY timing, {minute}, shard
+    ''')
+    totals = {}
+    arrivals = []
+    for row in cursor.fetchall():
+        slot = totals.setdefault(row['timing'], [0, 0])
+        slot[0] += row['passes']
+        slot[1] += row['guests']
+        if row['minute'] is not None:
+            arrivals.append((row['timing'], row['minute'], row['shard'], row['passes'], row['guests']))
     
+    param = sql_param()
+    cursor.executemany(f'INSERT INTO slot_totals (timing, passes, guests) VALUES ({param}, {param}, {param})',
+                       [(timing, passes, guests) for timing, (passes, guests) in totals.items()])
+    cursor.executemany(f'INSERT INTO slot_arrivals (timing, minute, shard, scans, guests) '
+                       f'VALUES ({param}, {param}, {param}, {param}, {param})', arrivals)
+    return len(totals), len({(timing, minute) for timing, minute, *_ in arrivals})
+
+def migration_scan_events(cursor, pg):
+    """Append-only log of scan attempts (see ScanEventWriter)"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS scan_events (
+            id {'BIGSERIAL' if pg else 'INTEGER'} PRIMARY KEY,
+            pass_id TEXT,
+            device TEXT,
+            admin TEXT,
+            outcome TEXT NOT NULL,
+            ts TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_events_pass ON scan_events (pass_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_events_ts ON scan_events (ts)')
+
+def migration_arrivals_off_claim_path(cursor, pg):
+    """Stop claims touching slot_arrivals: ScanEventWriter adds new scans in its group
+    commits; the triggers only move or remove arrivals of already-scanned passes"""
+    new_totals, new_arrivals = rollup_sql('NEW', '', pg)
+    old_totals, old_arrivals = rollup_sql('OLD', '-', pg)
+    slot_changed = 'OLD.timing IS DISTINCT FROM NEW.timing OR OLD.pass_type IS DISTINCT FROM NEW.pass_type' if pg \
+        else 'OLD.timing IS NOT NEW.timing OR OLD.pass_type IS NOT NEW.pass_type'
+    # A claim sets scanned_at on an unscanned pass, so OLD.scanned_at IS NULL skips it
+    rescanned = f"OLD.scanned_at IS NOT NULL AND ({'OLD.scanned_at IS DISTINCT FROM NEW.scanned_at' if pg else 'OLD.scanned_at IS NOT NEW.scanned_at'} OR {slot_changed})"
+    
+    if pg:
+        cursor.execute(f'''
+            CREATE OR REPLACE FUNCTION rollup_pass_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {new_totals};
+                    {new_arrivals};
+                ELSIF TG_OP = 'DELETE' THEN
+                    {old_totals};
+                    {old_arrivals};
+                ELSE
+                    IF {slot_changed} THEN
+                        {old_totals};
+                        {new_totals};
+                    END IF;
+                    IF {rescanned} THEN
+                        {old_arrivals};
+                        {new_arrivals};
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+    else:
+        cursor.execute('DROP TRIGGER IF EXISTS passes_rollup_scan')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS passes_rollup_rescan
+            AFTER UPDATE OF timing, pass_type, scanned_at ON passes WHEN {rescanned}
+            BEGIN {old_arrivals}; {new_arrivals}; END
+        ''')
+
+# slot_arrivals rows per (timing, minute); each pass's scans land in one of them
+ARRIVAL_SHARDS = 16
+
+def arrival_shard(pass_id, pg):
+    """Shard expression for a pass's arrivals. Concurrent claims in the same minute then
+    update different rows on PostgreSQL; SQLite serializes writers, so it uses one"""
+    return f'(hashtext({pass_id}) & {ARRIVAL_SHARDS - 1})' if pg else '0'
+
+def sharded_arrivals_sql(ref, sign, pg):
+    """rollup_sql's arrivals statement for the sharded slot_arrivals"""
+    guests = f"CASE WHEN {ref}.pass_type = 'COUPLE' THEN 2 ELSE 1 END"
+    minute = f"date_trunc('minute', {ref}.scanned_at)" if pg else f"strftime('%Y-%m-%d %H:%M', {ref}.scanned_at)"
+    return f'''
+        INSERT INTO slot_arrivals (timing, minute, shard, scans, guests)
+        SELECT {ref}.timing, {minute}, {arrival_shard(f'{ref}.pass_id', pg)}, {sign}1, {sign}{guests}
+        WHERE {ref}.scanned_at IS NOT NULL
+        ON CONFLICT (timing, minute, shard) DO UPDATE
+        SET scans = slot_arrivals.scans + excluded.scans, guests = slot_arrivals.guests + excluded.guests
+    '''
+
+def migration_sharded_arrivals(cursor, pg):
+    """Arrivals back in the claim transaction, so they cannot drift from passes, but
+    spread over ARRIVAL_SHARDS rows per minute so claims do not queue on one row"""
+    cursor.execute('DROP TABLE IF EXISTS slot_arrivals')
+    cursor.execute(f'''
+        CREATE TABLE slot_arrivals (
+            timing TEXT NOT NULL,
+            minute {'TIMESTAMP' if pg else 'TEXT'} NOT NULL,
+            shard INTEGER NOT NULL DEFAULT 0,
+            scans INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (timing, minute, shard)
+        )
+    ''')
+    
+    new_totals, _ = rollup_sql('NEW', '', pg)
+    old_totals, _ = rollup_sql('OLD', '-', pg)
+    new_arrivals = sharded_arrivals_sql('NEW', '', pg)
+    old_arrivals = sharded_arrivals_sql('OLD', '-', pg)
+    slot_changed = 'OLD.timing IS DISTINCT FROM NEW.timing OR OLD.pass_type IS DISTINCT FROM NEW.pass_type' if pg \
+        else 'OLD.timing IS NOT NEW.timing OR OLD.pass_type IS NOT NEW.pass_type'
+    scan_changed = ('OLD.scanned_at IS DISTINCT FROM NEW.scanned_at' if pg else 'OLD.scanned_at IS NOT NEW.scanned_at') \
+        + f' OR {slot_changed}'
+    
+    if pg:
+        cursor.execute(f'''
+            CREATE OR REPLACE FUNCTION rollup_pass_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {new_totals};
+                    {new_arrivals};
+                ELSIF TG_OP = 'DELETE' THEN
+                    {old_totals};
+                    {old_arrivals};
+                ELSE
+                    IF {slot_changed} THEN
+                        {old_totals};
+                        {new_totals};
+                    END IF;
+                    IF {scan_changed} THEN
+                        {old_arrivals};
+                        {new_arrivals};
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+    else:
+        for name in ('insert', 'delete', 'scan', 'rescan'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS passes_rollup_{name}')
+        triggers = [
+            ('insert', 'AFTER INSERT', '', [new_totals, new_arrivals]),
+            ('delete', 'AFTER DELETE', '', [old_totals, old_arrivals]),
+            ('scan', 'AFTER UPDATE OF timing, pass_type, scanned_at', f'WHEN {scan_changed}', [old_arrivals, new_arrivals]),
+        ]
+        for name, event, when, statements in triggers:
+            body = ';'.join(statements)
+            cursor.execute(f'''
+                CREATE TRIGGER passes_rollup_{name}
+                {event} ON passes {when}
+                BEGIN {body}; END
+            ''')
+    
+    rebuild_rollups(cursor, pg)
+
+MIGRATIONS = [
+    (1, 'initial_schema', migration_initial_schema),
+    (2, 'pass_change_log', migration_pass_change_log),
+    (3, 'search_indexes', migration_search_indexes),
+    (4, 'scan_indexes', migration_scan_indexes),
+    (5, 'default_admins', migration_default_admins),
+    (6, 'timing_rollups', migration_timing_rollups),
+    (7, 'scan_events', migration_scan_events),
+    (8, 'arrivals_off_claim_path', migration_arrivals_off_claim_path),
+    (9, 'sharded_arrivals', migration_sharded_arrivals),
+]
+
+# Arbitrary key for pg_advisory_xact_lock: one migrator at a time across instances
+MIGRATION_LOCK_ID = 7461
+
+def applied_migrations(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT version FROM schema_version')
+    return {row['version'] for row in cursor.fetchall()}
+
+def migrate():
+    """Apply pending migrations in order; returns the names applied"""
+    conn = get_db()
+    cursor = conn.cursor()
+    pg = is_postgres()
+    param = sql_param()
+    applied = []
+    
+    try:
+        if pg:
+            cursor.execute(f'SELECT pg_advisory_xact_lock({param})', (MIGRATION_LOCK_ID,))
+        done = applied_migrations(cursor)
+        conn.commit()
+        
+        for version, name, apply in MIGRATIONS:
+            if version in done:
+                continue
+            if pg:
+                cursor.execute(f'SELECT pg_advisory_xact_lock({param})', (MIGRATION_LOCK_ID,))
+                # Another instance may have applied it while we waited for the lock
+                cursor.execute(f'SELECT 1 FROM schema_version WHERE version = {param}', (version,))
+                if cursor.fetchone():
+                    conn.commit()
+                    continue
+            apply(cursor, pg)
+            cursor.execute(f'INSERT INTO schema_version (version, name) VALUES ({param}, {param})', (version, name))
+            conn.commit()
+            applied.append(name)
+    finally:
+        conn.close()
+    return applied
+
+def pending_migrations():
+    conn = get_db()
+    cursor = conn.cursor()
+    done = applied_migrations(cursor)
     conn.commit()
     conn.close()
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in done]
+
+def init_db():
+    """Create or upgrade the schema (tests, scripts and `python app.py`)"""
+    return migrate()
+
+@app.cli.command('migrate')
+@click.option('--list', 'list_only', is_flag=True, help='Only show pending migrations')
+def migrate_command(list_only):
+    """Apply pending database migrations"""
+    if list_only:
+        pending = pending_migrations()
+        for version, name in pending:
+            click.echo(f'pending {version:>3} {name}')
+        click.echo(f'{len(pending)} pending migration(s)')
+        return
+    
+    start = time.perf_counter()
+    applied = migrate()
+    for name in applied:
+        click.echo(f'applied {name}')
+    click.echo(f'Schema up to date ({len(applied)} applied) in {time.perf_counter() - start:.2f}s')
+
+def pg_try(cursor, sql):
+    """Run an optional PostgreSQL statement (e.g. CREATE EXTENSION) without aborting the transaction"""
+    cursor.execute('SAVEPOINT optional_ddl')
+    try:
+        cursor.execute(sql)
+    except Exception as e:
+        cursor.execute('ROLLBACK TO SAVEPOINT optional_ddl')
+        app.logger.info('Skipped optional DDL: %s', e)
+        return False
+    cursor.execute('RELEASE SAVEPOINT optional_ddl')
+    return True
+
+def create_pg_search_indexes(cursor):
+    """Trigram index over case- and accent-folded names, pattern indexes on phones"""
+    has_trgm = pg_try(cursor, 'CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    has_unaccent = pg_try(cursor, 'CREATE EXTENSION IF NOT EXISTS unaccent')
+    
+    cursor.execute("SELECT 1 FROM pg_proc WHERE proname = 'epass_fold'")
+    if not cursor.fetchone():
+        # unaccent() is only STABLE; the two-argument form can be wrapped as IMMUTABLE
+        body = "lower(public.unaccent('public.unaccent', $1))" if has_unaccent else 'lower($1)'
+        cursor.execute(f'''
+            CREATE FUNCTION epass_fold(text) RETURNS text
+            AS $$ SELECT {body} $$
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        ''')
+    
+    if has_trgm:
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_passes_names_trgm ON passes
+            USING gin (epass_fold(name1 || ' ' || COALESCE(name2, '')) gin_trgm_ops)
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_phone1 ON passes (phone1 text_pattern_ops)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_passes_phone2 ON passes (phone2 text_pattern_ops)')
+
+def fold_text(text):
+    """Case- and diacritic-folded text for name matching"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def search_condition(search):
+    """Indexed WHERE fragment for the /database search box.
+
+    Digit-only queries match phone number prefixes; anything else matches
+    folded names (FTS5 token prefixes on SQLite, trigram substrings on
+    PostgreSQL). Returns (sql, params).
+    """
+    param = sql_param()
+    digits = re.sub(r'[\s+-]', '', search)
+    
+    if digits.isascii() and digits.isdigit():
+        if is_postgres():
+            pattern = digits + '%'
+            return '(phone1 LIKE %s OR phone2 LIKE %s)', [pattern, pattern]
+        # Range scan on the phone indexes (SQLite LIKE cannot use them)
+        upper = digits[:-1] + chr(ord(digits[-1]) + 1)
+        return '((phone1 >= ? AND phone1 < ?) OR (phone2 >= ? AND phone2 < ?))', [digits, upper, digits, upper]
+    
+    if is_postgres():
+        return "epass_fold(name1 || ' ' || COALESCE(name2, '')) LIKE '%%' || epass_fold(%s) || '%%'", [search]
+    
+    tokens = re.findall(r'\w+', fold_text(search))
+    if not tokens:
+        return '1 = 0', []
+    match = ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+    return f'pass_id IN (SELECT pass_id FROM passes_fts WHERE passes_fts MATCH {param})', ['{name1 name2}: ' + match]
+
+def pass_filters(search='', filter_scanned='', filter_type=''):
+    """WHERE clause shared by the database listing and CSV export. Returns (sql, params)"""
+    param = sql_param()
+    conditions = []
+    params = []
+    
+    if search:
+        condition, search_params = search_condition(search)
+        conditions.append(condition)
+        params.extend(search_params)
+    
+    if filter_scanned == 'scanned':
+        conditions.append('scanned_at IS NOT NULL')
+    elif filter_scanned == 'unscanned':
+        conditions.append('scanned_at IS NULL')
+    
+    if filter_type in ['SINGLE', 'COUPLE']:
+        conditions.append(f'pass_type = {param}')
+        params.append(filter_type)
+    
+    return ' AND '.join(conditions) or '1=1', params
 
 def login_required(f):
     """Decorator to require login"""
@@ -122,14 +1149,134 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+class SampledLog:
+    """Structured log lines for noisy events: the first few per reason each
+    period, then one in every `sample`, each carrying the running count"""
+
+    def __init__(self, logger, burst=5, sample=100, period=60):
+        self.logger = logger
+        self.burst = burst
+        self.sample = sample
+        self.period = period
+        self._counts = {}
+        self._period_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def event(self, event, reason, **fields):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._period_start >= self.period:
+                self._counts.clear()
+                self._period_start = now
+            count = self._counts[event, reason] = self._counts.get((event, reason), 0) + 1
+        if count > self.burst and count % self.sample:
+            return
+        
+        record = {'event': event, 'reason': reason, 'count': count}
+        if has_request_context():
+            record.update(remote_addr=request.remote_addr, user=session.get('username'))
+        record.update(fields)
+        self.logger.warning(json.dumps(record, default=str))
+
+scan_log = SampledLog(logging.getLogger('epass.scan'), sample=SCAN_LOG_SAMPLE)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    request_db_time.set([0, 0.0])
+
+@app.after_request
+def note_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    """Latency and database time per route. Streamed responses wrap their generator
+    in stream_with_context, which holds teardown until the stream is closed"""
+    totals = request_db_time.get()
+    request_db_time.set(None)
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.labels(route, request.method, g.pop('metrics_status', 500)).observe(time.perf_counter() - start)
+    REQUEST_DB_QUERIES.labels(route).observe(totals[0])
+    REQUEST_DB_SECONDS.labels(route).observe(totals[1])
+    pool = db_pool_stats()
+    DB_CONNECTIONS.labels('open').set(pool['open'])
+    if 'in_use' in pool:
+        DB_CONNECTIONS.labels('in_use').set(pool['in_use'])
+
+def count_scan_outcome(endpoint, body, status):
+    """Count an /api/scan response by outcome (the batch endpoints' status names); returns the outcome"""
+    outcome = body['status']
+    if outcome == 'error':
+        outcome = 'not_found' if status == 404 else 'invalid'
+    SCAN_OUTCOMES.labels(endpoint, outcome).inc()
+    return outcome
+
+def count_batch_outcomes(endpoint, results):
+    tally = {}
+    for result in results:
+        tally[result['status']] = tally.get(result['status'], 0) + 1
+    for outcome, count in tally.items():
+        SCAN_OUTCOMES.labels(endpoint, outcome).inc(count)
+
+# Keyed once; copy() skips re-deriving the HMAC pads for every payload
+_QR_HMAC = hmac.new(QR_SECRET.encode('utf-8'), digestmod=hashlib.sha256)
+
+def sign_pass_id(pass_id):
+    """HMAC-SHA256 signature of a pass ID"""
+    mac = _QR_HMAC.copy()
+    mac.update(pass_id.encode('utf-8'))
+    return mac.hexdigest()
+
+def qr_tag(pass_id):
+    """Tag shipped to offline scanners to check QR payloads locally: a SHA-256 of the
+    signature bytes both payload formats carry, so a snapshot reveals none of them"""
+    mac = _QR_HMAC.copy()
+    mac.update(pass_id.encode('utf-8'))
+    return hashlib.sha256(mac.digest()[:QR_COMPACT_SIG_BYTES]).hexdigest()[:QR_TAG_LENGTH]
+
+# Lowercase hyphenated UUID, the form uuid4() pass IDs are stored in
+_CANONICAL_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+# RFC 4648 base32 for the fixed 25-byte compact body (40 chars, no padding).
+# The stdlib codec is pure Python; these go through C int/str routines instead.
+_B32_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+_B32_PAIRS = [a + b for a in _B32_ALPHABET for b in _B32_ALPHABET]
+_B32_TO_DIGITS = bytes.maketrans(_B32_ALPHABET.encode('ascii'), b'0123456789abcdefghijklmnopqrstuv')
+_B32_SHIFTS = range(190, -10, -10)
+_COMPACT_BODY = re.compile(r'[A-Z2-7]{40}')
+
+def _b32encode_compact(packed):
+    n = int.from_bytes(packed, 'big')
+    return ''.join([_B32_PAIRS[(n >> shift) & 1023] for shift in _B32_SHIFTS])
+
+def _b32decode_compact(text):
+    return int(text.encode('ascii').translate(_B32_TO_DIGITS), 32).to_bytes(25, 'big')
+
 def generate_qr_payload(pass_id):
-    """Generate QR payload with HMAC signature"""
+    """Generate QR payload with HMAC signature.
+
+    Pass IDs are UUIDs, so the compact format packs the 16 raw bytes and a
+    truncated signature into 40 base32 characters, which QR alphanumeric mode
+    encodes in a much smaller symbol. Anything else falls back to the legacy
+    base64 JSON format.
+    """
+    if not _CANONICAL_UUID.fullmatch(pass_id):
+        return generate_legacy_qr_payload(pass_id)
+    
+    mac = _QR_HMAC.copy()
+    mac.update(pass_id.encode('ascii'))
+    packed = bytes.fromhex(pass_id.replace('-', '')) + mac.digest()[:QR_COMPACT_SIG_BYTES]
+    return QR_COMPACT_PREFIX + _b32encode_compact(packed)
+
+def generate_legacy_qr_payload(pass_id):
+    """Original base64 JSON payload; still accepted from passes printed before the compact format"""
     # Create HMAC signature
-    signature = hmac.new(
-        QR_SECRET.encode('utf-8'),
-        pass_id.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
+    signature = sign_pass_id(pass_id)
     
     # Create payload
     payload = {
@@ -144,7 +1291,37 @@ def generate_qr_payload(pass_id):
     return b64_payload
 
 def verify_qr_payload(b64_payload):
-    """Verify QR payload and return pass_id if valid"""
+    """Verify QR payload (compact or legacy) and return pass_id if valid"""
+    if not isinstance(b64_payload, str):
+        return None
+    start = time.perf_counter()
+    pass_id = check_qr_payload(b64_payload)
+    QR_VERIFY_SECONDS.labels('compact' if b64_payload.startswith(QR_COMPACT_PREFIX) else 'legacy').observe(
+        time.perf_counter() - start
+    )
+    return pass_id
+
+def check_qr_payload(b64_payload):
+    if len(b64_payload) > QR_PAYLOAD_MAX:
+        scan_log.event('qr_rejected', 'too_long', length=len(b64_payload))
+        return None
+    
+    if b64_payload.startswith(QR_COMPACT_PREFIX):
+        body = b64_payload[len(QR_COMPACT_PREFIX):]
+        if not _COMPACT_BODY.fullmatch(body):
+            scan_log.event('qr_rejected', 'malformed', payload=b64_payload[:48])
+            return None
+        
+        packed = _b32decode_compact(body)
+        h = packed[:16].hex()
+        pass_id = f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+        mac = _QR_HMAC.copy()
+        mac.update(pass_id.encode('ascii'))
+        if hmac.compare_digest(packed[16:], mac.digest()[:QR_COMPACT_SIG_BYTES]):
+            return pass_id
+        scan_log.event('qr_rejected', 'bad_signature', pass_id=pass_id)
+        return None
+    
     try:
         # Decode base64
         json_str = base64.b64decode(b64_payload.encode('utf-8')).decode('utf-8')
@@ -153,23 +1330,21 @@ def verify_qr_payload(b64_payload):
         pass_id = payload.get('id')
         signature = payload.get('sig')
         
-        if not pass_id or not signature:
+        if not isinstance(pass_id, str) or not isinstance(signature, str) or not pass_id or not signature:
+            scan_log.event('qr_rejected', 'missing_fields', payload=b64_payload[:48])
             return None
         
         # Recompute signature
-        expected_sig = hmac.new(
-            QR_SECRET.encode('utf-8'),
-            pass_id.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
+        expected_sig = sign_pass_id(pass_id)
         
         # Timing-safe comparison
         if hmac.compare_digest(signature, expected_sig):
             return pass_id
         
+        scan_log.event('qr_rejected', 'bad_signature', pass_id=pass_id[:64])
         return None
     except Exception as e:
-        print(f"QR verification error: {e}")
+        scan_log.event('qr_rejected', 'malformed', error=type(e).__name__, payload=b64_payload[:48])
         return None
 
 @app.route('/')
@@ -179,6 +1354,49 @@ def index():
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
+# bcrypt releases the GIL, so a small thread pool caps how much CPU a wave of
+# logins can take; request threads wait on it without holding the GIL, and
+# logins beyond BCRYPT_MAX_PENDING are turned away instead of piling up
+password_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_password_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+class PasswordCheckBusy(Exception):
+    """Too many password checks are already queued"""
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+def hash_rounds(password_hash):
+    """Cost factor of a bcrypt hash ($2b$<rounds>$...)"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def check_password(password, password_hash):
+    """bcrypt check on the password executor; raises PasswordCheckBusy when it is saturated"""
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        return password_executor.submit(
+            bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8')
+        ).result()
+    finally:
+        _password_slots.release()
+
+def rehash_password(username, password):
+    """Re-hash a password at the current BCRYPT_ROUNDS (runs on the password executor)"""
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        param = sql_param()
+        cursor.execute(f'UPDATE admins SET password_hash = {param} WHERE username = {param}',
+                       (hash_password(password), username))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        app.logger.warning('Password rehash failed for %s: %s', username, e)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Admin login page"""
@@ -193,8 +1411,15 @@ def login():
         admin = cursor.fetchone()
         conn.close()
         
-        if admin and bcrypt.checkpw(password.encode('utf-8'), admin['password_hash'].encode('utf-8')):
+        try:
+            valid = admin is not None and check_password(password, admin['password_hash'])
+        except PasswordCheckBusy:
+            return render_template('login.html', error='Too many logins right now, please try again in a few seconds'), 503
+        
+        if valid:
             session['username'] = username
+            if hash_rounds(admin['password_hash']) != BCRYPT_ROUNDS:
+                password_executor.submit(rehash_password, username, password)
             return redirect(url_for('dashboard'))
         
         return render_template('login.html', error='Invalid username or password')
@@ -207,117 +1432,418 @@ def logout():
     session.pop('username', None)
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    """Dashboard with statistics"""
-    conn = get_db()
+# All dashboard counters in one conditional-aggregation pass over passes
+STATS_SQL = '''
+        SELECT
+            COUNT(*) AS total_passes,
+            COALESCE(SUM(CASE WHEN pass_type = 'SINGLE' THEN 1 ELSE 0 END), 0) AS single_count,
+            COALESCE(SUM(CASE WHEN pass_type = 'COUPLE' THEN 1 ELSE 0 END), 0) AS couple_count,
+            COALESCE(SUM(CASE WHEN payment_mode = 'CASH' THEN amount ELSE 0 END), 0) AS cash_total,
+            COALESCE(SUM(CASE WHEN payment_mode = 'ONLINE' THEN amount ELSE 0 END), 0) AS online_total,
+            COALESCE(SUM(CASE WHEN scanned_at IS NOT NULL THEN 1 ELSE 0 END), 0) AS scanned_count
+        FROM passes
+'''
+
+def stats_from_row(row):
+    stats = {key: int(row[key]) for key in (
+        'total_passes', 'single_count', 'couple_count', 'cash_total', 'online_total', 'scanned_count'
+    )}
+    stats['total_revenue'] = stats['cash_total'] + stats['online_total']
+    stats['unscanned_count'] = stats['total_passes'] - stats['scanned_count']
+    return stats
+
+def compute_stats():
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
+    cursor.execute(STATS_SQL)
+    row = cursor.fetchone()
+    conn.close()
+    return stats_from_row(row)
+
+_stats_cache = {}
+_stats_lock = threading.Lock()
+
+def fresh_stats():
+    """The cached stats snapshot if it is still within STATS_CACHE_TTL, else None"""
+    cached = _stats_cache.get(DATABASE_URL)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def store_stats(stats):
+    _stats_cache[DATABASE_URL] = (time.monotonic() + STATS_CACHE_TTL, stats)
+
+def get_stats():
+    """Dashboard stats snapshot, cached per process for STATS_CACHE_TTL seconds"""
+    stats = fresh_stats()
+    if stats is not None:
+        return stats
     
-    # Total passes
-    cursor.execute('SELECT COUNT(*) as count FROM passes')
-    total_passes = cursor.fetchone()['count']
-    
-    # Single vs Couple
-    param = sql_param()
-    cursor.execute(f"SELECT COUNT(*) as count FROM passes WHERE pass_type = {param}", ('SINGLE',))
-    single_count = cursor.fetchone()['count']
-    
-    cursor.execute(f"SELECT COUNT(*) as count FROM passes WHERE pass_type = {param}", ('COUPLE',))
-    couple_count = cursor.fetchone()['count']
+    with _stats_lock:
+        # Another thread may have refreshed it while we waited
+        stats = fresh_stats()
+        if stats is None:
+            stats = compute_stats()
+            store_stats(stats)
+        return stats
+
+def invalidate_stats():
+    """Drop the cached stats snapshot after a write"""
+    note_write()
+    _stats_cache.clear()
+    stats_publisher.notify()
+
+class StatsPublisher:
+    """One background thread per worker fanning stats deltas out to SSE clients.
+
+    Local writes wake it immediately; writes from other workers are picked up
+    by polling the cached snapshot, so DB load does not grow with clients.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last = None
+
+    def notify(self):
+        self._wake.set()
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= STATS_STREAM_MAX_CLIENTS:
+                return None
+            subscriber = queue.Queue(maxsize=32)
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stats-publisher', daemon=True)
+                self._thread.start()
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, stats):
+        """Send the counters that changed since the last publish"""
+        last = self._last or {}
+        delta = {key: value for key, value in stats.items() if last.get(key) != value}
+        self._last = stats
+        if not delta:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(delta)
+            except queue.Full:
+                # Slow client: it gets a fresh snapshot when it reconnects
+                self.unsubscribe(subscriber)
+
+    def _run(self):
+        while True:
+            self._wake.wait(STATS_STREAM_POLL)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    continue
+            try:
+                self.publish(get_stats())
+            except Exception as e:
+                app.logger.warning('Stats publisher failed: %s', e)
+
+stats_publisher = StatsPublisher()
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    """Dashboard with statistics"""
+    return render_template('dashboard.html', stats=get_stats(), username=session.get('username'))
+
+@app.route('/api/stats')
+@login_required
+def api_stats():
+    """Current dashboard counters as JSON"""
+    return jsonify(get_stats())
+
+def arrival_rollups():
+    """Entry analytics per timing slot, read only from the rollup tables"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute('SELECT timing, passes, guests FROM slot_totals WHERE passes > 0 ORDER BY timing')
+    slots = {row['timing']: {
+        'timing': row['timing'],
+        'passes': row['passes'],
+        'guests': row['guests'],
+        'scanned': 0,
+        'scanned_guests': 0,
+        'peak_per_minute': 0,
+        'peak_minute': None,
+        'minutes': []
+    } for row in cursor.fetchall()}
+    cursor.execute('''
+        SELECT timing, minute, SUM(scans) AS scans, SUM(guests) AS guests FROM slot_arrivals
+        GROUP BY timing, minute HAVING SUM(scans) > 0 ORDER BY minute
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
     
-    # Payment breakdown
-    cursor.execute(f"SELECT COALESCE(SUM(amount), 0) as total FROM passes WHERE payment_mode = {param}", ('CASH',))
-    cash_total = cursor.fetchone()['total']
+    for row in rows:
+        slot = slots.get(row['timing'])
+        if slot is None:
+            continue
+        minute = str(row['minute'])[:16]
+        slot['minutes'].append([minute, row['scans'], row['guests']])
+        slot['scanned'] += row['scans']
+        slot['scanned_guests'] += row['guests']
+        if row['guests'] > slot['peak_per_minute']:
+            slot['peak_per_minute'] = row['guests']
+            slot['peak_minute'] = minute
+    return list(slots.values())
+
+@app.route('/api/arrivals')
+@login_required
+def api_arrivals():
+    """Arrivals per minute, scanned vs expected and peak rate for each timing slot"""
+    return jsonify({'slots': arrival_rollups()})
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the timing-slot rollups from passes"""
+    start = time.perf_counter()
+    conn = get_db()
+    try:
+        slots, minutes = rebuild_rollups(conn.cursor(), is_postgres())
+        conn.commit()
+    finally:
+        conn.close()
+    click.echo(f'Rebuilt {slots} timing slots and {minutes} minute buckets in {time.perf_counter() - start:.2f}s')
+
+@app.route('/api/stats/stream')
+@login_required
+def api_stats_stream():
+    """Server-Sent Events stream of dashboard counter changes"""
+    subscriber = stats_publisher.subscribe()
+    if subscriber is None:
+        return jsonify({'status': 'error', 'message': 'Too many live dashboards, falling back to polling'}), 503
     
-    cursor.execute(f"SELECT COALESCE(SUM(amount), 0) as total FROM passes WHERE payment_mode = {param}", ('ONLINE',))
-    online_total = cursor.fetchone()['total']
+    def stream():
+        deadline = time.monotonic() + STATS_STREAM_MAX_AGE
+        try:
+            yield f'retry: 3000\nevent: snapshot\ndata: {json.dumps(get_stats())}\n\n'
+            # Streams are recycled so an open dashboard never holds a worker thread for long
+            while time.monotonic() < deadline:
+                try:
+                    delta = subscriber.get(timeout=STATS_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'data: {json.dumps(delta)}\n\n'
+        finally:
+            stats_publisher.unsubscribe(subscriber)
     
-    # Total revenue
-    total_revenue = cash_total + online_total
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def validate_pass(form):
+    """Normalize and validate pass fields from a form or CSV row. Returns (pass_data, errors)"""
+    name1 = (form.get('name1') or '').strip()
+    phone1 = (form.get('phone1') or '').strip()
+    name2 = (form.get('name2') or '').strip()
+    phone2 = (form.get('phone2') or '').strip()
+    pass_type = (form.get('pass_type') or '').strip().upper()
+    timing = (form.get('timing') or '').strip()
+    payment_mode = (form.get('payment_mode') or '').strip().upper()
+    txn_info = (form.get('txn_info') or '').strip() or None
     
-    # Scanned stats
-    cursor.execute('SELECT COUNT(*) as count FROM passes WHERE scanned_at IS NOT NULL')
-    scanned_count = cursor.fetchone()['count']
+    # Validation
+    errors = []
     
-    conn.close()
+    if not name1:
+        errors.append('Name 1 is required')
+    if not phone1 or len(phone1) != 10 or not phone1.isdigit():
+        errors.append('Phone 1 must be 10 digits')
+    if pass_type not in ['SINGLE', 'COUPLE']:
+        errors.append('Invalid pass type')
+    if pass_type == 'COUPLE':
+        if not name2:
+            errors.append('Name 2 is required for couple pass')
+        if not phone2 or len(phone2) != 10 or not phone2.isdigit():
+            errors.append('Phone 2 must be 10 digits for couple pass')
+    if not timing:
+        errors.append('Timing is required')
+    if payment_mode not in ['CASH', 'ONLINE']:
+        errors.append('Invalid payment mode')
     
-    stats = {
-        'total_passes': total_passes,
-        'single_count': single_count,
-        'couple_count': couple_count,
-        'cash_total': cash_total,
-        'online_total': online_total,
-        'total_revenue': total_revenue,
-        'scanned_count': scanned_count,
-        'unscanned_count': total_passes - scanned_count
+    pass_data = {
+        'name1': name1,
+        'phone1': phone1,
+        'name2': name2,
+        'phone2': phone2,
+        'pass_type': pass_type,
+        'amount': PRICE_COUPLE if pass_type == 'COUPLE' else PRICE_SINGLE,
+        'payment_mode': payment_mode,
+        'txn_info': txn_info,
+        'timing': timing
     }
-    
-    return render_template('dashboard.html', stats=stats, username=session.get('username'))
+    return pass_data, errors
+
+PASS_INSERT_COLUMNS = ['pass_id', 'name1', 'phone1', 'name2', 'phone2', 'pass_type', 'amount', 'payment_mode', 'txn_info', 'timing']
 
 @app.route('/generate', methods=['GET', 'POST'])
 @login_required
 def generate():
     """Generate new pass"""
     if request.method == 'POST':
-        # Get form data
-        name1 = request.form.get('name1', '').strip()
-        phone1 = request.form.get('phone1', '').strip()
-        name2 = request.form.get('name2', '').strip()
-        phone2 = request.form.get('phone2', '').strip()
-        pass_type = request.form.get('pass_type', '').upper()
-        timing = request.form.get('timing', '').strip()
-        payment_mode = request.form.get('payment_mode', '').upper()
-        txn_info = request.form.get('txn_info', '').strip() or None
-        
-        # Validation
-        errors = []
-        
-        if not name1:
-            errors.append('Name 1 is required')
-        if not phone1 or len(phone1) != 10 or not phone1.isdigit():
-            errors.append('Phone 1 must be 10 digits')
-        if pass_type not in ['SINGLE', 'COUPLE']:
-            errors.append('Invalid pass type')
-        if pass_type == 'COUPLE':
-            if not name2:
-                errors.append('Name 2 is required for couple pass')
-            if not phone2 or len(phone2) != 10 or not phone2.isdigit():
-                errors.append('Phone 2 must be 10 digits for couple pass')
-        if not timing:
-            errors.append('Timing is required')
-        if payment_mode not in ['CASH', 'ONLINE']:
-            errors.append('Invalid payment mode')
+        pass_data, errors = validate_pass(request.form)
         
         if errors:
             return render_template('generate.html', errors=errors, form_data=request.form)
         
-        # Set amount
-        amount = PRICE_COUPLE if pass_type == 'COUPLE' else PRICE_SINGLE
-        
         # Generate pass ID
         pass_id = str(uuid.uuid4())
+        pass_data['pass_id'] = pass_id
         
         # Insert into database
+        conn = get_db()
         try:
-            conn = get_db()
             cursor = conn.cursor()
             param = sql_param()
             cursor.execute(f'''
-                INSERT INTO passes (pass_id, name1, phone1, name2, phone2, pass_type, amount, payment_mode, txn_info, timing)
-                VALUES ({param}, {param}, {param}, {param}, {param}, {param}, {param}, {param}, {param}, {param})
-            ''', (pass_id, name1, phone1, name2, phone2, pass_type, amount, payment_mode, txn_info, timing))
+                INSERT INTO passes ({', '.join(PASS_INSERT_COLUMNS)})
+                VALUES ({', '.join([param] * len(PASS_INSERT_COLUMNS))})
+            ''', [pass_data[c] for c in PASS_INSERT_COLUMNS])
             conn.commit()
-            conn.close()
-            
-            return redirect(url_for('preview', pass_id=pass_id))
-            
         except Exception as e:
-            errors.append(f'A pass already exists for {name1} with phone {phone1}')
+            errors.append(f'A pass already exists for {pass_data["name1"]} with phone {pass_data["phone1"]}')
             return render_template('generate.html', errors=errors, form_data=request.form)
+        finally:
+            conn.close()
+        
+        invalidate_stats()
+        return redirect(url_for('preview', pass_id=pass_id))
     
     return render_template('generate.html')
 
+# CSV header (lowercased, spaces/underscores removed) -> pass field; accepts export headers too
+IMPORT_HEADERS = {
+    'name1': 'name1', 'phone1': 'phone1', 'name2': 'name2', 'phone2': 'phone2',
+    'passtype': 'pass_type', 'type': 'pass_type', 'timing': 'timing',
+    'paymentmode': 'payment_mode', 'payment': 'payment_mode',
+    'txninfo': 'txn_info', 'transactioninfo': 'txn_info'
+}
+IMPORT_CHUNK_SIZE = 1000
+
+def insert_pass_chunk(cursor, rows):
+    """Insert validated passes, skipping UNIQUE(name1, phone1) conflicts. Returns inserted pass_ids"""
+    values = [[row[c] for c in PASS_INSERT_COLUMNS] for row in rows]
+    columns = ', '.join(PASS_INSERT_COLUMNS)
+    
+    if is_postgres():
+        from psycopg2.extras import execute_values
+        inserted = execute_values(
+            cursor,
+            f'INSERT INTO passes ({columns}) VALUES %s ON CONFLICT (name1, phone1) DO NOTHING RETURNING pass_id',
+            values,
+            page_size=len(values),
+            fetch=True
+        )
+        return {row['pass_id'] for row in inserted}
+    
+    placeholders = ', '.join(['?'] * len(PASS_INSERT_COLUMNS))
+    cursor.executemany(
+        f'INSERT INTO passes ({columns}) VALUES ({placeholders}) ON CONFLICT (name1, phone1) DO NOTHING',
+        values
+    )
+    cursor.execute(
+        'SELECT pass_id FROM passes WHERE pass_id IN (SELECT value FROM json_each(?))',
+        (json.dumps([row['pass_id'] for row in rows]),)
+    )
+    return {row['pass_id'] for row in cursor.fetchall()}
+
+def import_passes(csv_file, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream passes from a CSV file into the database in chunked transactions.
+
+    Rows get the same validation as generate(). Returns a report with the
+    imported count and per-row invalid/duplicate entries (by CSV line).
+    """
+    reader = csv.DictReader(csv_file)
+    fields = {h: IMPORT_HEADERS.get(re.sub(r'[\s_]', '', h.lower())) for h in reader.fieldnames or []}
+    missing = {'name1', 'phone1', 'pass_type', 'timing', 'payment_mode'} - set(fields.values())
+    if missing:
+        raise ValueError(f'CSV is missing columns: {", ".join(sorted(missing))}')
+    
+    report = {'imported': 0, 'invalid': [], 'duplicates': []}
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    def flush(chunk):
+        inserted = insert_pass_chunk(cursor, chunk)
+        conn.commit()
+        report['imported'] += len(inserted)
+        for row in chunk:
+            if row['pass_id'] not in inserted:
+                report['duplicates'].append({'line': row['line'], 'name1': row['name1'], 'phone1': row['phone1']})
+    
+    try:
+        chunk = []
+        for record in reader:
+            pass_data, errors = validate_pass({fields[h]: v for h, v in record.items() if fields.get(h)})
+            if errors:
+                report['invalid'].append({'line': reader.line_num, 'errors': errors})
+                continue
+            pass_data['pass_id'] = str(uuid.uuid4())
+            pass_data['line'] = reader.line_num
+            chunk.append(pass_data)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    finally:
+        conn.close()
+        invalidate_stats()
+    
+    return report
+
+@app.route('/import-csv', methods=['GET', 'POST'])
+@login_required
+def import_csv():
+    """Bulk pass import from an uploaded CSV"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return render_template('import.html', error='Choose a CSV file to import')
+        try:
+            # Not TextIOWrapper: the upload is a SpooledTemporaryFile, which before Python 3.11
+            # lacks readable() and friends. The stream reader keeps line endings as csv needs
+            report = import_passes(codecs.getreader('utf-8-sig')(upload.stream))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return render_template('import.html', error=str(e))
+        return render_template('import.html', report=report)
+    
+    return render_template('import.html')
+
+@app.cli.command('import-passes')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per transaction')
+def import_passes_command(csv_path, chunk_size):
+    """Bulk import passes from CSV_PATH"""
+    start = time.perf_counter()
+    with open(csv_path, encoding='utf-8-sig', newline='') as csv_file:
+        report = import_passes(csv_file, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    
+    for row in report['invalid']:
+        click.echo(f"line {row['line']}: invalid - {'; '.join(row['errors'])}")
+    for row in report['duplicates']:
+        click.echo(f"line {row['line']}: duplicate - pass already exists for {row['name1']} with phone {row['phone1']}")
+    click.echo(f"Imported {report['imported']} passes in {elapsed:.1f}s "
+               f"({len(report['duplicates'])} duplicates, {len(report['invalid'])} invalid)")
+
 @app.route('/preview/<pass_id>')
 @login_required
 def preview(pass_id):
@@ -332,14 +1858,226 @@ def preview(pass_id):
     if not pass_data:
         return "Pass not found", 404
     
-    # Generate QR payload
-    qr_payload = generate_qr_payload(pass_id)
+    # QR image is served by pass_qr(), so the template only needs the row
+    return render_template('preview.html', pass_data=dict(pass_data))
+
+class RenderCache:
+    """In-memory LRU of rendered images backed by a content-addressed directory on disk"""
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0}
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key[:2], f'{key}.{ext}')
+
+    def get(self, key, ext, render):
+        """Return cached bytes for key, calling render() only on a full miss"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+        
+        path = self.path(key, ext)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.counters['disk_hits'] += 1
+        except OSError:
+            data = render()
+            self.counters['renders'] += 1
+            self.store(path, data)
+        
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    @staticmethod
+    def store(path, data):
+        """Atomically write to the disk cache; failures only cost a re-render later"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            app.logger.warning('Render cache write failed: %s', e)
+
+render_cache = RenderCache(QR_CACHE_DIR, QR_CACHE_SIZE)
+
+def render_key(kind, *parts):
+    """Content address for a rendered asset: hash of everything that affects its bytes"""
+    material = '\x1f'.join([RENDER_VERSION, kind] + [str(p) for p in parts])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def make_qr(payload):
+    import segno
+    return segno.make(payload, error='h', micro=False)
+
+def render_qr(payload, fmt):
+    """QR code image for payload as PNG or SVG bytes"""
+    buffer = io.BytesIO()
+    if fmt == 'png':
+        make_qr(payload).save(buffer, kind='png', scale=QR_PNG_SCALE, border=2)
+    else:
+        make_qr(payload).save(buffer, kind='svg', border=2, omitsize=True, xmldecl=False)
+    return buffer.getvalue()
+
+CARD_FIELDS = ['pass_id', 'name1', 'phone1', 'name2', 'phone2', 'pass_type', 'amount', 'payment_mode', 'timing', 'created_at']
+
+def render_card(pass_data):
+    """Printable SVG pass card with the QR embedded as vector paths"""
+    qr_svg = make_qr(generate_qr_payload(pass_data['pass_id'])).svg_inline(border=2, omitsize=True)
+    qr_svg = qr_svg.replace('<svg ', '<svg width="180" height="180" ', 1)
+    return render_template('pass_card.svg', pass_data=pass_data, qr_svg=qr_svg).encode('utf-8')
+
+def card_key(pass_data):
+    return render_key('card', generate_qr_payload(pass_data['pass_id']), *[pass_data[f] for f in CARD_FIELDS])
+
+def cached_image_response(key, ext, mimetype, render, max_age):
+    """Serve a rendered asset with ETag revalidation, rendering only on a cache miss"""
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(render_cache.get(key, ext, render), mimetype=mimetype)
+    response.set_etag(key)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}'
+    return response
+
+@app.route('/qr/<pass_id>.<any(png, svg):fmt>')
+@login_required
+def pass_qr(pass_id, fmt):
+    """QR code image for a pass (the payload only depends on the pass ID)"""
+    payload = generate_qr_payload(pass_id)
+    key = render_key('qr', fmt, payload)
+    mimetype = 'image/png' if fmt == 'png' else 'image/svg+xml'
+    return cached_image_response(key, fmt, mimetype, lambda: render_qr(payload, fmt), 86400)
+
+@app.route('/pass/<pass_id>/card.svg')
+@login_required
+def pass_card(pass_id):
+    """Printable pass card"""
+    conn = get_db()
+    cursor = conn.cursor()
+    param = sql_param()
+    cursor.execute(f'SELECT {", ".join(CARD_FIELDS)} FROM passes WHERE pass_id = {param}', (pass_id,))
+    pass_data = cursor.fetchone()
+    conn.close()
+    
+    if not pass_data:
+        return "Pass not found", 404
+    
+    pass_data = dict(pass_data)
+    return cached_image_response(card_key(pass_data), 'svg', 'image/svg+xml', lambda: render_card(pass_data), 0)
+
+@app.cli.command('render-cards')
+def render_cards_command():
+    """Pre-render every pass card and QR code into the render cache"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {", ".join(CARD_FIELDS)} FROM passes')
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
     
-    # Convert to dict for template
-    pass_dict = dict(pass_data)
-    pass_dict['qr_payload'] = qr_payload
+    start = time.perf_counter()
+    for n, pass_data in enumerate(rows, 1):
+        payload = generate_qr_payload(pass_data['pass_id'])
+        for fmt in ('png', 'svg'):
+            render_cache.get(render_key('qr', fmt, payload), fmt, lambda: render_qr(payload, fmt))
+        render_cache.get(card_key(pass_data), 'svg', lambda: render_card(pass_data))
+        if n % 500 == 0:
+            click.echo(f'{n}/{len(rows)} rendered')
+    click.echo(f'Rendered {len(rows)} passes in {time.perf_counter() - start:.1f}s into {QR_CACHE_DIR} ({render_cache.counters})')
+
+PRINT_PACK_CHUNK = 200
+
+def card_filename(pass_data):
+    """Deterministic card file name; changes when anything printed on the card changes"""
+    return f"{pass_data['pass_id']}-{card_key(pass_data)[:12]}.svg"
+
+def render_card_files(out_dir, passes):
+    """Process-pool task: write card SVGs into out_dir, skipping ones already there.
+
+    Cards come through the shared disk render cache, so anything already
+    rendered by `flask render-cards` or a preview is copied, not re-rendered.
+    """
+    written = 0
+    with app.app_context():
+        for pass_data in passes:
+            path = os.path.join(out_dir, card_filename(pass_data))
+            if os.path.exists(path):
+                continue
+            data = render_cache.get(card_key(pass_data), 'svg', lambda: render_card(pass_data))
+            RenderCache.store(path, data)
+            written += 1
+    return written, len(passes)
+
+def build_print_pack(out_dir, where, params, workers=None, progress=None):
+    """Render every matching pass card into out_dir using a process pool.
+
+    Existing cards are skipped, so an interrupted run resumes where it
+    stopped. Writes print.html laying the cards out for printing to PDF.
+    Returns (cards written, total).
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {", ".join(CARD_FIELDS)} FROM passes WHERE {where} ORDER BY created_at, pass_id', params)
+    passes = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = [passes[i:i + PRINT_PACK_CHUNK] for i in range(0, len(passes), PRINT_PACK_CHUNK)]
+    written = done = 0
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_card_files, out_dir, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_written, chunk_size = future.result()
+            written += chunk_written
+            done += chunk_size
+            if progress:
+                progress(done, len(passes), written)
     
-    return render_template('preview.html', pass_data=pass_dict)
+    with open(os.path.join(out_dir, 'print.html'), 'w', encoding='utf-8') as f:
+        f.write(render_template('print_pack.html', files=[card_filename(p) for p in passes]))
+    
+    return written, len(passes)
+
+@app.cli.command('print-pack')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--search', default='', help='Same search as the /database page')
+@click.option('--scanned', type=click.Choice(['', 'scanned', 'unscanned']), default='')
+@click.option('--type', 'pass_type', type=click.Choice(['', 'SINGLE', 'COUPLE']), default='')
+@click.option('--workers', type=int, default=None, help='Render processes (default: CPU count)')
+@click.option('--zip', 'zip_path', type=click.Path(dir_okay=False), help='Also bundle the pack into a ZIP file')
+def print_pack_command(out_dir, search, scanned, pass_type, workers, zip_path):
+    """Render printable cards for all matching passes into OUT_DIR (resumable)"""
+    where, params = pass_filters(search, scanned, pass_type)
+    start = time.perf_counter()
+    
+    def progress(done, total, written):
+        elapsed = time.perf_counter() - start
+        click.echo(f'{done}/{total} cards ({written} new, {done / elapsed:.0f}/s)')
+    
+    with app.app_context():
+        written, total = build_print_pack(out_dir, where, params, workers=workers, progress=progress)
+    click.echo(f'{total} cards in {out_dir} ({written} new) in {time.perf_counter() - start:.1f}s; '
+               f'open print.html and print to PDF')
+    
+    if zip_path:
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for name in sorted(os.listdir(out_dir)):
+                if name.endswith(('.svg', '.html')):
+                    bundle.write(os.path.join(out_dir, name), name)
+        click.echo(f'Wrote {zip_path}')
 
 @app.route('/regenerate/<pass_id>')
 @login_required
@@ -354,194 +2092,1104 @@ def scanner():
     """QR scanner page"""
     return render_template('scanner.html', username=session.get('username'))
 
-@app.route('/api/scan', methods=['POST'])
-@login_required
-def api_scan():
-    """API endpoint to scan QR code"""
-    data = request.get_json()
-    qr_payload = data.get('payload', '')
+def pass_info(pass_data):
+    """Public subset of a pass row returned to scanners"""
+    return {
+        'name1': pass_data['name1'],
+        'phone1': pass_data['phone1'],
+        'name2': pass_data['name2'],
+        'phone2': pass_data['phone2'],
+        'pass_type': pass_data['pass_type'],
+        'timing': pass_data['timing']
+    }
+
+class PassStateCache:
+    """Bounded per-worker cache of pass states the gate can answer without the database.
+
+    Only terminal states are cached: passes that are already scanned (nothing
+    un-scans a pass) and pass IDs that do not exist (negative entries with a
+    short TTL). Unscanned passes always go to the database for the atomic
+    claim, so entries never need invalidating when another worker scans.
+    """
+
+    def __init__(self, max_entries, ttl, missing_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._database_url = None
+        self._warmed = False
+        self.counters = {'hits': 0, 'misses': 0, 'warmed': 0}
+
+    def _check_database(self):
+        # Caller holds the lock; entries belong to one database
+        if self._database_url != DATABASE_URL:
+            self._entries.clear()
+            self._database_url = DATABASE_URL
+            self._warmed = False
+
+    def get(self, pass_id):
+        """Cached (pass_info, scanned_at, scanned_by), MISSING, or None on a miss"""
+        with self._lock:
+            self._check_database()
+            entry = self._entries.get(pass_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(pass_id)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def remember(self, pass_id, row):
+        """Record what a claim or lookup learned about a pass (row is None if it does not exist)"""
+        if row is None:
+            ttl, value = self.missing_ttl, MISSING
+        elif row['scanned_at']:
+            ttl, value = self.ttl, (pass_info(row), row['scanned_at'], row['scanned_by'])
+        else:
+            return
+        
+        with self._lock:
+            self._check_database()
+            self._entries[pass_id] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(pass_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def warm(self):
+        """Load the most recently scanned passes, once per worker and database"""
+        with self._lock:
+            self._check_database()
+            if self._warmed:
+                return
+            self._warmed = True
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT * FROM passes WHERE scanned_at IS NOT NULL ORDER BY scanned_at DESC LIMIT {sql_param()}',
+            (self.max_entries,)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        # Oldest first so the most recent scans end up least likely to be evicted
+        for row in reversed(rows):
+            self.remember(row['pass_id'], row)
+        self.counters['warmed'] += len(rows)
+
+    def warm_in_background(self):
+        """Warm from a daemon thread at worker start-up, so no scan waits for the query"""
+        def run():
+            try:
+                self.warm()
+            except Exception as e:
+                app.logger.warning('Gate cache warm-up failed: %s', e)
+        thread = threading.Thread(target=run, name='pass-cache-warm', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+MISSING = object()
+
+pass_cache = PassStateCache(PASS_CACHE_SIZE, PASS_CACHE_TTL, PASS_CACHE_MISSING_TTL)
+
+# UPDATE ... RETURNING needs SQLite 3.35+
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Single-pass claim; parameters (scanned_at, username, pass_id, pass_id)
+CLAIM_PASS_PG_SQL = '''
+    WITH claimed AS (
+        UPDATE passes
+        SET scanned_at = COALESCE(%s::timestamp, CURRENT_TIMESTAMP), scanned_by = %s
+        WHERE pass_id = %s AND scanned_at IS NULL
+        RETURNING *
+    )
+    SELECT TRUE AS claimed, c.* FROM claimed c
+    UNION ALL
+    SELECT FALSE AS claimed, p.* FROM passes p
+    WHERE p.pass_id = %s AND NOT EXISTS (SELECT 1 FROM claimed)
+'''
+
+# Every part of a WITH statement reads one snapshot: when a concurrent scan claims the
+# pass first, the UPDATE skips it but the lookup still sees the row unscanned. Such rows
+# (not claimed, scanned_at NULL) are re-read by a second statement, which sees that claim
+REREAD_PASSES_PG_SQL = 'SELECT * FROM passes WHERE pass_id = ANY(%s)'
+
+def reread_lost_claims(cursor, results):
+    """Re-read passes lost to a concurrent claim in {pass_id: (claimed, row)} (PostgreSQL)"""
+    lost = [pass_id for pass_id, (claimed, row) in results.items() if not claimed and row['scanned_at'] is None]
+    if lost:
+        cursor.execute(REREAD_PASSES_PG_SQL, (lost,))
+        fresh = {row['pass_id']: row for row in cursor.fetchall()}
+        for pass_id in lost:
+            if pass_id in fresh:
+                results[pass_id] = (False, fresh[pass_id])
+            else:
+                del results[pass_id]
+    return results
+
+# Parameters (scanned_at, username, pass_id); append RETURNING * where supported
+CLAIM_PASS_SQLITE_SQL = '''
+    UPDATE passes
+    SET scanned_at = COALESCE(?, CURRENT_TIMESTAMP), scanned_by = ?
+    WHERE pass_id = ? AND scanned_at IS NULL
+'''
+
+def claim_pass(cursor, pass_id, username, scanned_at=None):
+    """Atomically mark a pass as scanned.
+
+    Returns (claimed, row): claimed is True if this call scanned the pass,
+    row is the pass row (None if the pass does not exist). On PostgreSQL the
+    claim and the already-scanned lookup are a single statement. scanned_at
+    overrides the scan time (offline scans synced later); default is now.
+    """
+    if is_postgres():
+        cursor.execute(CLAIM_PASS_PG_SQL, (scanned_at, username, pass_id, pass_id))
+        row = cursor.fetchone()
+        if not row:
+            return False, None
+        return reread_lost_claims(cursor, {pass_id: (row['claimed'], row)}).get(pass_id, (False, None))
+    
+    if SQLITE_HAS_RETURNING:
+        cursor.execute(CLAIM_PASS_SQLITE_SQL + ' RETURNING *', (scanned_at, username, pass_id))
+        row = cursor.fetchone()
+        claimed = row is not None
+    else:
+        cursor.execute(CLAIM_PASS_SQLITE_SQL, (scanned_at, username, pass_id))
+        claimed = cursor.rowcount == 1
+        row = None
+    
+    if row is None:
+        # Not claimed (or no RETURNING): in-process lookup, no network round trip
+        cursor.execute('SELECT * FROM passes WHERE pass_id = ?', (pass_id,))
+        row = cursor.fetchone()
+    return claimed, row
+
+def claim_passes(cursor, claims, username):
+    """Set-based claim of many passes in one UPDATE.
+
+    claims maps pass_id -> scanned_at (None for now). Returns
+    {pass_id: (claimed, row)} for every pass that exists.
+    """
+    pass_ids = list(claims)
+    
+    if is_postgres():
+        # Lock rows in pass_id order so overlapping batches cannot deadlock
+        cursor.execute('''
+            WITH input AS (
+                SELECT * FROM unnest(%s::text[], %s::timestamp[]) AS i(pass_id, scanned_at)
+            ), locked AS (
+                SELECT p.pass_id FROM passes p JOIN input i ON i.pass_id = p.pass_id
+                WHERE p.scanned_at IS NULL
+                ORDER BY p.pass_id
+                FOR UPDATE OF p
+            ), claimed AS (
+                UPDATE passes p
+                SET scanned_at = COALESCE(i.scanned_at, CURRENT_TIMESTAMP), scanned_by = %s
+                FROM input i
+                WHERE p.pass_id = i.pass_id AND p.scanned_at IS NULL
+                  AND p.pass_id IN (SELECT pass_id FROM locked)
+                RETURNING p.*
+            )
+            SELECT TRUE AS claimed, c.* FROM claimed c
+            UNION ALL
+            SELECT FALSE AS claimed, p.* FROM passes p JOIN input i ON i.pass_id = p.pass_id
+            WHERE NOT EXISTS (SELECT 1 FROM claimed c WHERE c.pass_id = p.pass_id)
+        ''', (pass_ids, [claims[p] for p in pass_ids], username))
+        return reread_lost_claims(cursor, {row['pass_id']: (row['claimed'], row) for row in cursor.fetchall()})
+    
+    if not SQLITE_HAS_RETURNING:
+        results = {}
+        for pass_id in pass_ids:
+            claimed, row = claim_pass(cursor, pass_id, username, scanned_at=claims[pass_id])
+            if row:
+                results[pass_id] = (claimed, row)
+        return results
+    
+    cursor.execute('''
+        WITH input(pass_id, scanned_at) AS (
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+        )
+        UPDATE passes
+        SET scanned_at = COALESCE(input.scanned_at, CURRENT_TIMESTAMP), scanned_by = ?
+        FROM input
+        WHERE passes.pass_id = input.pass_id AND passes.scanned_at IS NULL
+        RETURNING *
+    ''', (json.dumps([[p, claims[p]] for p in pass_ids]), username))
+    results = {row['pass_id']: (True, row) for row in cursor.fetchall()}
+    
+    remaining = [p for p in pass_ids if p not in results]
+    if remaining:
+        cursor.execute(
+            'SELECT * FROM passes WHERE pass_id IN (SELECT value FROM json_each(?))',
+            (json.dumps(remaining),)
+        )
+        for row in cursor.fetchall():
+            results[row['pass_id']] = (False, row)
+    return results
+
+def scan_batch(cursor, items, username):
+    """Resolve (pass_id, scanned_at) items in order; the first item for a pass claims it.
+
+    pass_id is None for payloads that failed verification. Returns one
+    result dict per item.
+    """
+    claims = {}
+    rows = {}
+    for pass_id, scanned_at in items:
+        if not pass_id or pass_id in claims or pass_id in rows:
+            continue
+        cached = pass_cache.get(pass_id)
+        if cached is None:
+            claims[pass_id] = scanned_at
+        elif cached is not MISSING:
+            rows[pass_id] = (False, {'scanned_at': cached[1], 'scanned_by': cached[2]})
     
+    if claims:
+        claimed = claim_passes(cursor, claims, username)
+        for pass_id in claims:
+            found = claimed.get(pass_id)
+            pass_cache.remember(pass_id, found[1] if found else None)
+        rows.update(claimed)
+    
+    results = []
+    admitted = set()
+    for pass_id, _ in items:
+        found = rows.get(pass_id) if pass_id else None
+        if not pass_id:
+            results.append({'status': 'invalid'})
+        elif not found:
+            results.append({'status': 'not_found', 'pass_id': pass_id})
+        elif found[0] and pass_id not in admitted:
+            admitted.add(pass_id)
+            results.append({'status': 'success', 'pass_id': pass_id})
+        else:
+            row = found[1]
+            results.append({
+                'status': 'already_scanned',
+                'pass_id': pass_id,
+                'scanned_at': str(row['scanned_at']) if row['scanned_at'] else None,
+                'scanned_by': row['scanned_by']
+            })
+    return results
+
+class TokenBucketLimiter:
+    """In-process token buckets, refilled lazily when a key is seen; idle keys are evicted LRU"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take a token for key; returns (allowed, seconds until the next token)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / self.rate
+
+class RequestCoalescer:
+    """Share one result between identical requests: concurrent duplicates wait for
+    the first, and repeats within `window` seconds of it reuse its result"""
+
+    def __init__(self, window, max_entries=10000):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'leaders': 0, 'coalesced': 0}
+
+    def run(self, key, fn):
+        """Returns (result, shared): shared is True when another request's result was reused"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            leader = entry is None or entry['expires'] <= now
+            if leader:
+                entry = {'expires': float('inf'), 'done': threading.Event(), 'result': None}
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        
+        if not leader:
+            entry['done'].wait(DB_POOL_TIMEOUT)
+            if entry['result'] is not None:
+                self.counters['coalesced'] += 1
+                return entry['result'], True
+            # The first request failed or is stuck: do the work ourselves
+            return fn(), False
+        
+        self.counters['leaders'] += 1
+        try:
+            entry['result'] = fn()
+        finally:
+            entry['expires'] = time.monotonic() + self.window
+            entry['done'].set()
+        return entry['result'], False
+
+scan_limiter = TokenBucketLimiter(SCAN_RATE, SCAN_BURST)
+scan_coalescer = RequestCoalescer(SCAN_COALESCE_WINDOW)
+
+def event_time():
+    """UTC timestamp for a scan event, in the text form the scan columns use (ms precision)"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+class ScanEventWriter:
+    """Group-committed appends to scan_events from one background thread per worker.
+
+    record() never touches the database: it queues the event and returns. The
+    thread takes the first queued event, gathers whatever else arrives within
+    flush_interval (at most batch_size events), and writes the group with one
+    INSERT and one commit. When the queue is full or a write fails, events are
+    dropped and counted rather than slowing down scans.
+    """
+
+    def __init__(self, flush_interval, batch_size, max_pending):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.counters = {'queued': 0, 'written': 0, 'commits': 0, 'dropped': 0}
+
+    def _pending(self):
+        """This process's queue, with its writer thread started (again, after a fork)"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid() or not self._thread.is_alive():
+                    if self._pid != os.getpid():
+                        self._queue = queue.Queue(self.max_pending)
+                        self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='scan-event-writer', daemon=True)
+                    self._thread.start()
+        return self._queue
+
+    def record(self, pass_id, device, admin, outcome, ts=None):
+        self.record_many([(pass_id, device, admin, outcome, ts)])
+
+    def record_many(self, events):
+        """Queue (pass_id, device, admin, outcome, ts) events; ts None means now"""
+        pending = self._pending()
+        now = event_time()
+        for pass_id, device, admin, outcome, ts in events:
+            try:
+                pending.put_nowait((pass_id, device, admin, outcome, ts or now))
+                self.counters['queued'] += 1
+            except queue.Full:
+                self.counters['dropped'] += 1
+
+    def flush(self, timeout=5):
+        """Wait until every queued event has been written (or dropped); False on timeout"""
+        pending = self._queue
+        if pending is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        with pending.all_tasks_done:
+            while pending.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                pending.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(pending.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    pending.task_done()
+
+    def _write(self, batch):
+        conn = None
+        try:
+            conn = get_db()
+            cursor = conn.cursor()
+            if is_postgres():
+                from psycopg2.extras import execute_values
+                execute_values(
+                    cursor,
+                    'INSERT INTO scan_events (pass_id, device, admin, outcome, ts) VALUES %s',
+                    batch,
+                    page_size=len(batch)
+                )
+            else:
+                cursor.executemany(
+                    'INSERT INTO scan_events (pass_id, device, admin, outcome, ts) VALUES (?, ?, ?, ?, ?)',
+                    batch
+                )
+            conn.commit()
+            self.counters['written'] += len(batch)
+            self.counters['commits'] += 1
+        except Exception as e:
+            self.counters['dropped'] += len(batch)
+            app.logger.error('Scan event write failed, %d events dropped: %s', len(batch), e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def stats(self):
+        pending = self._queue
+        return {'pending': pending.qsize() if pending is not None else 0, **self.counters}
+
+scan_events = ScanEventWriter(SCAN_EVENT_FLUSH_MS / 1000, SCAN_EVENT_BATCH, SCAN_EVENT_QUEUE)
+# Gunicorn workers exit through sys.exit on graceful shutdown, so queued events get written
+atexit.register(scan_events.flush, 2)
+
+def log_scan_event(outcome, pass_id, admin, device):
+    """Append one /api/scan attempt to the scan event log (pass_id None if it never verified)"""
+    scan_events.record(pass_id, device, admin, outcome)
+
+def log_batch_events(results, admin, device, times=None):
+    """Append a batch or sync request's per-item results to the scan event log"""
+    times = times or [None] * len(results)
+    scan_events.record_many([
+        (result.get('pass_id'), device, admin, result['status'], ts)
+        for result, ts in zip(results, times)
+    ])
+
+def scanner_id():
+    """Identify the scanning device: the page's X-Scanner-Id, else the client address"""
+    return (request.headers.get('X-Scanner-Id') or request.remote_addr or '')[:64]
+
+def already_scanned_result(info, scanned_at, scanned_by):
+    return {
+        'status': 'already_scanned',
+        'message': 'This pass has already been used',
+        'scanned_at': scanned_at,
+        'scanned_by': scanned_by,
+        'pass_info': info
+    }, 400
+
+def scan_precheck(qr_payload):
+    """Everything before the database for one scan: returns (pass_id, None) when
+    the pass must be claimed, or (pass_id, (body, status)) when already answered;
+    pass_id is None if the payload did not verify"""
     # Verify QR payload
     pass_id = verify_qr_payload(qr_payload)
     
     if not pass_id:
-        return jsonify({'status': 'error', 'message': 'Invalid or tampered QR code'}), 400
+        return None, ({'status': 'error', 'message': 'Invalid or tampered QR code'}, 400)
+    
+    # Re-presented and unknown passes are answered from this worker's cache
+    cached = pass_cache.get(pass_id)
+    if cached is MISSING:
+        return pass_id, ({'status': 'error', 'message': 'Pass not found'}, 404)
+    if cached:
+        return pass_id, already_scanned_result(*cached)
+    return pass_id, None
+
+def scan_payload(qr_payload, username):
+    """Verify and claim one scanned payload; returns (pass_id, (response body, status code))"""
+    pass_id, answered = scan_precheck(qr_payload)
+    if answered:
+        return pass_id, answered
     
-    # Atomic update
+    # Claim the pass and fetch its row in one atomic operation
     conn = get_db()
     cursor = conn.cursor()
-    
-    # First check if pass exists
-    param = sql_param()
-    cursor.execute(f'SELECT * FROM passes WHERE pass_id = {param}', (pass_id,))
-    pass_data = cursor.fetchone()
+    claimed, pass_data = claim_pass(cursor, pass_id, username)
+    conn.commit()
+    conn.close()
+    return pass_id, scan_outcome(pass_id, claimed, pass_data)
+
+def scan_outcome(pass_id, claimed, pass_data):
+    """Response for a claim attempt; also feeds the pass cache and stats"""
+    pass_cache.remember(pass_id, pass_data)
+    if claimed:
+        invalidate_stats()
     
     if not pass_data:
-        conn.close()
-        return jsonify({'status': 'error', 'message': 'Pass not found'}), 404
+        return {'status': 'error', 'message': 'Pass not found'}, 404
     
-    # Check if already scanned
-    if pass_data['scanned_at']:
-        conn.close()
-        return jsonify({
-            'status': 'already_scanned',
-            'message': 'This pass has already been used',
-            'scanned_at': pass_data['scanned_at'],
-            'scanned_by': pass_data['scanned_by'],
-            'pass_info': {
-                'name1': pass_data['name1'],
-                'phone1': pass_data['phone1'],
-                'name2': pass_data['name2'],
-                'phone2': pass_data['phone2'],
-                'pass_type': pass_data['pass_type'],
-                'timing': pass_data['timing']
-            }
-        }), 400
-    
-    # Atomic update - only update if not scanned
-    param = sql_param()
-    cursor.execute(f'''
-        UPDATE passes 
-        SET scanned_at = CURRENT_TIMESTAMP, scanned_by = {param} 
-        WHERE pass_id = {param} AND scanned_at IS NULL
-    ''', (session.get('username'), pass_id))
-    rows_affected = cursor.rowcount
-    conn.commit()
+    if not claimed:
+        return already_scanned_result(pass_info(pass_data), pass_data['scanned_at'], pass_data['scanned_by'])
     
-    if rows_affected == 0:
-        # Race condition - already scanned
-        cursor.execute(f'SELECT * FROM passes WHERE pass_id = {param}', (pass_id,))
-        pass_data = cursor.fetchone()
-        conn.close()
-        return jsonify({
-            'status': 'already_scanned',
-            'message': 'This pass has already been used',
-            'scanned_by': pass_data['scanned_by']
-        }), 400
+    return {
+        'status': 'success',
+        'message': 'Pass scanned successfully',
+        'pass_info': pass_info(pass_data)
+    }, 200
+
+def rate_limited_result(device, retry_after):
+    scan_log.event('scan_rejected', 'rate_limited', scanner=device)
+    body = {'status': 'rate_limited', 'message': 'Too many scans from this device, slow down'}
+    return body, 429, {'Retry-After': str(max(1, round(retry_after)))}
+
+def scan_request_payload(data):
+    """The QR payload string from a scan request's JSON body ('' if missing or malformed)"""
+    qr_payload = data.get('payload', '') if isinstance(data, dict) else ''
+    return qr_payload if isinstance(qr_payload, str) else ''
+
+@app.route('/api/scan', methods=['POST'])
+@login_required
+def api_scan():
+    """API endpoint to scan QR code"""
+    username = session.get('username')
+    device = scanner_id()
     
-    # Get updated pass data
-    param = sql_param()
-    cursor.execute(f'SELECT * FROM passes WHERE pass_id = {param}', (pass_id,))
-    pass_data = cursor.fetchone()
+    allowed, retry_after = scan_limiter.allow((username, device))
+    if not allowed:
+        body, status, headers = rate_limited_result(device, retry_after)
+        log_scan_event(count_scan_outcome('scan', body, status), None, username, device)
+        return jsonify(body), status, headers
+    
+    qr_payload = scan_request_payload(request.get_json(silent=True))
+    
+    # The same frame decoded over and over by one device becomes a single DB operation
+    (pass_id, (body, status)), shared = scan_coalescer.run(
+        (username, device, qr_payload),
+        lambda: scan_payload(qr_payload, username)
+    )
+    if shared and body['status'] == 'success':
+        # Only one request admits the guest; repeats are answered from the pass cache
+        pass_id, (body, status) = scan_payload(qr_payload, username)
+    log_scan_event(count_scan_outcome('scan', body, status), pass_id, username, device)
+    return jsonify(body), status
+
+@app.route('/api/scan/snapshot')
+@login_required
+def api_scan_snapshot():
+    """Pass manifest for offline scanners: full, or the delta since a version"""
+    since = request.args.get('since', type=int)
+    
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    
+    # Read the version first: rows changed after this are resent next time
+    cursor.execute('SELECT COALESCE(MAX(version), 0) AS version FROM pass_changes')
+    version = cursor.fetchone()['version']
+    
+    columns = 'p.pass_id, p.name1, p.pass_type, p.timing, p.scanned_at, p.scanned_by'
+    if since is None or since <= 0:
+        cursor.execute(f'SELECT {columns} FROM passes p')
+    else:
+        # Sequence values can commit out of order, so re-read a small overlap
+        param = sql_param()
+        cursor.execute(f'''
+            SELECT c.pass_id AS changed_id, {columns}
+            FROM (SELECT DISTINCT pass_id FROM pass_changes WHERE version > {param}) c
+            LEFT JOIN passes p ON p.pass_id = c.pass_id
+        ''', (max(since - SNAPSHOT_OVERLAP, 0),))
+    rows = cursor.fetchall()
     conn.close()
     
+    passes = []
+    removed = []
+    for row in rows:
+        if row['pass_id'] is None:
+            removed.append(row['changed_id'])
+            continue
+        passes.append([
+            row['pass_id'],
+            qr_tag(row['pass_id']),
+            row['name1'],
+            row['pass_type'],
+            row['timing'],
+            str(row['scanned_at']) if row['scanned_at'] else None,
+            row['scanned_by']
+        ])
+    
     return jsonify({
-        'status': 'success',
-        'message': 'Pass scanned successfully',
-        'pass_info': {
-            'name1': pass_data['name1'],
-            'phone1': pass_data['phone1'],
-            'name2': pass_data['name2'],
-            'phone2': pass_data['phone2'],
-            'pass_type': pass_data['pass_type'],
-            'timing': pass_data['timing']
-        }
+        'version': version,
+        'full': since is None or since <= 0,
+        'fields': ['pass_id', 'tag', 'name1', 'pass_type', 'timing', 'scanned_at', 'scanned_by'],
+        'passes': passes,
+        'removed': removed
     })
 
+def offline_scan_time(value):
+    """Convert a device timestamp (epoch ms) to a UTC DB timestamp, never in the future"""
+    now = datetime.utcnow()
+    try:
+        scanned_at = min(datetime.utcfromtimestamp(float(value) / 1000), now)
+    except (TypeError, ValueError, OverflowError, OSError):
+        scanned_at = now
+    return scanned_at.strftime('%Y-%m-%d %H:%M:%S')
+
+def batch_items(data, key):
+    """Validate the list under key in a batch request body; returns (items, error_response)"""
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return None, (jsonify({'status': 'error', 'message': f'{key} must be a list'}), 400)
+    if len(items) > SCAN_BATCH_MAX:
+        return None, (jsonify({'status': 'error', 'message': f'At most {SCAN_BATCH_MAX} {key} per request'}), 413)
+    return items, None
+
+@app.route('/api/scan/sync', methods=['POST'])
+@login_required
+def api_scan_sync():
+    """Apply queued offline scans in one transaction; the earliest scan of a pass wins"""
+    events, error = batch_items(request.get_json(silent=True), 'events')
+    if error:
+        return error
+    
+    events = [e if isinstance(e, dict) else {} for e in events]
+    times = [offline_scan_time(e.get('scanned_at')) for e in events]
+    order = sorted(range(len(events)), key=lambda i: times[i])
+    items = [(verify_qr_payload(str(events[i].get('payload', ''))), times[i]) for i in order]
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    resolved = scan_batch(cursor, items, session.get('username'))
+    conn.commit()
+    conn.close()
+    invalidate_stats()
+    
+    results = [None] * len(events)
+    for i, result in zip(order, resolved):
+        results[i] = result
+    count_batch_outcomes('sync', results)
+    log_batch_events(results, session.get('username'), scanner_id(), times)
+    return jsonify({'status': 'ok', 'results': results})
+
+@app.route('/api/scan/batch', methods=['POST'])
+@login_required
+def api_scan_batch():
+    """Scan many payloads in one request; results are returned in input order"""
+    payloads, error = batch_items(request.get_json(silent=True), 'payloads')
+    if error:
+        return error
+    
+    items = [(verify_qr_payload(str(p)), None) for p in payloads]
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    results = scan_batch(cursor, items, session.get('username'))
+    conn.commit()
+    conn.close()
+    invalidate_stats()
+    count_batch_outcomes('batch', results)
+    log_batch_events(results, session.get('username'), scanner_id())
+    
+    return jsonify({'status': 'ok', 'results': results})
+
+SCAN_EVENT_PAGE_MAX = 1000
+
+@app.route('/api/scan/events')
+@login_required
+def api_scan_events():
+    """Scan attempts from the event log, oldest first; filter by pass_id, device, admin,
+    outcome or since (UTC timestamp), and page with after=<id of the last event seen>"""
+    param = sql_param()
+    clauses = []
+    params = []
+    for column in ('pass_id', 'device', 'admin', 'outcome'):
+        value = request.args.get(column)
+        if value:
+            clauses.append(f'{column} = {param}')
+            params.append(value)
+    since = request.args.get('since')
+    if since:
+        clauses.append(f'ts >= {param}')
+        params.append(since)
+    clauses.append(f'id > {param}')
+    params.append(request.args.get('after', 0, type=int))
+    limit = min(max(request.args.get('limit', 100, type=int), 1), SCAN_EVENT_PAGE_MAX)
+    
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute(
+        f'SELECT id, pass_id, device, admin, outcome, ts FROM scan_events WHERE {" AND ".join(clauses)} '
+        f'ORDER BY id LIMIT {param}',
+        params + [limit]
+    )
+    events = [{**dict(row), 'ts': str(row['ts'])} for row in cursor.fetchall()]
+    conn.close()
+    return jsonify({'events': events, 'next': events[-1]['id'] if events else None})
+
+@app.route('/api/scan/events/summary')
+@login_required
+def api_scan_events_summary():
+    """Scan attempts per outcome over the last ?minutes= (default 15), from the event log only"""
+    minutes = min(max(request.args.get('minutes', 15, type=int), 1), 24 * 60)
+    since = (datetime.utcnow() - timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute(
+        f'SELECT outcome, COUNT(*) AS attempts FROM scan_events WHERE ts >= {sql_param()} GROUP BY outcome',
+        (since,)
+    )
+    outcomes = {row['outcome']: row['attempts'] for row in cursor.fetchall()}
+    conn.close()
+    return jsonify({'since': since, 'minutes': minutes, 'outcomes': outcomes, 'attempts': sum(outcomes.values())})
+
+def encode_cursor(row):
+    """Opaque pagination cursor for a pass row: its (created_at, pass_id) key"""
+    created_at = row['created_at']
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=' ')
+    raw = json.dumps([created_at, row['pass_id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor_value):
+    """Inverse of encode_cursor; None for a missing or malformed cursor"""
+    if not cursor_value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor_value + '=' * (-len(cursor_value) % 4))
+        created_at, pass_id = json.loads(raw)
+        if isinstance(created_at, str) and isinstance(pass_id, str):
+            return [created_at, pass_id]
+    except (ValueError, TypeError):
+        pass
+    return None
+
+def approximate_total(filter_scanned, filter_type, search):
+    """Total for the listing from the cached stats snapshot, or None if filters rule that out"""
+    if search or (filter_scanned and filter_type in ['SINGLE', 'COUPLE']):
+        return None
+    stats = get_stats()
+    if filter_scanned == 'scanned':
+        return stats['scanned_count']
+    if filter_scanned == 'unscanned':
+        return stats['unscanned_count']
+    if filter_type == 'SINGLE':
+        return stats['single_count']
+    if filter_type == 'COUPLE':
+        return stats['couple_count']
+    return stats['total_passes']
+
 @app.route('/database')
 @login_required
 def database():
     """Database/search page"""
     # Get query parameters
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '').strip()
     filter_scanned = request.args.get('scanned', '')
     filter_type = request.args.get('type', '')
+    after = decode_cursor(request.args.get('after', ''))
+    before = None if after else decode_cursor(request.args.get('before', ''))
+    exact_count = request.args.get('count') == 'exact'
     
     per_page = 20
-    offset = (page - 1) * per_page
-    
     param = sql_param()
+    key = f'({param}::timestamp, {param})' if is_postgres() else f'({param}, {param})'
     
     # Build query
-    query = 'SELECT * FROM passes WHERE 1=1'
-    params = []
+    where, params = pass_filters(search, filter_scanned, filter_type)
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
     
-    if search:
-        query += f' AND (name1 LIKE {param} OR phone1 LIKE {param} OR name2 LIKE {param} OR phone2 LIKE {param})'
-        search_param = f'%{search}%'
-        params.extend([search_param, search_param, search_param, search_param])
+    # Exact totals cost a full COUNT, so they are only computed on request
+    total_count = None
+    if exact_count:
+        cursor.execute(f'SELECT COUNT(*) AS count FROM passes WHERE {where}', params)
+        total_count = cursor.fetchone()['count']
     
-    if filter_scanned == 'scanned':
-        query += ' AND scanned_at IS NOT NULL'
-    elif filter_scanned == 'unscanned':
-        query += ' AND scanned_at IS NULL'
+    # Keyset pagination on (created_at, pass_id): constant cost at any depth
+    page_where, page_params, order = where, list(params), 'DESC'
+    if after:
+        page_where += f' AND (created_at, pass_id) < {key}'
+        page_params.extend(after)
+    elif before:
+        page_where += f' AND (created_at, pass_id) > {key}'
+        page_params.extend(before)
+        order = 'ASC'
     
-    if filter_type in ['SINGLE', 'COUPLE']:
-        query += f' AND pass_type = {param}'
-        params.append(filter_type)
-    
-    # Get total count
-    count_query = query.replace('SELECT *', 'SELECT COUNT(*) AS count')
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(count_query, params)
-    total_count = cursor.fetchone()['count']  # Use dictionary-style access for both SQLite and PostgreSQL
-    
-    # Get paginated results
-    query += f' ORDER BY created_at DESC LIMIT {param} OFFSET {param}'
-    params.extend([per_page, offset])
-    cursor.execute(query, params)
+    cursor.execute(
+        f'SELECT * FROM passes WHERE {page_where} ORDER BY created_at {order}, pass_id {order} LIMIT {param}',
+        page_params + [per_page + 1]
+    )
     passes = cursor.fetchall()
     conn.close()
     
-    total_pages = (total_count + per_page - 1) // per_page
+    has_more = len(passes) > per_page
+    passes = passes[:per_page]
+    if before:
+        passes.reverse()
+    
+    has_newer = bool(after) or (before is not None and has_more)
+    has_older = bool(before) or (not before and has_more)
+    
+    if total_count is None:
+        total_count = approximate_total(filter_scanned, filter_type, search)
     
     return render_template('database.html', 
                          passes=passes, 
-                         page=page, 
-                         total_pages=total_pages,
+                         prev_cursor=encode_cursor(passes[0]) if has_newer and passes else None,
+                         next_cursor=encode_cursor(passes[-1]) if has_older and passes else None,
                          search=search,
                          filter_scanned=filter_scanned,
                          filter_type=filter_type,
-                         total_count=total_count)
+                         total_count=total_count,
+                         exact_count=exact_count)
+
+# Export columns in output order: column -> CSV header
+EXPORT_COLUMNS = {
+    'pass_id': 'Pass ID',
+    'name1': 'Name 1',
+    'phone1': 'Phone 1',
+    'name2': 'Name 2',
+    'phone2': 'Phone 2',
+    'pass_type': 'Pass Type',
+    'amount': 'Amount',
+    'payment_mode': 'Payment Mode',
+    'txn_info': 'Transaction Info',
+    'timing': 'Timing',
+    'created_at': 'Created At',
+    'scanned_at': 'Scanned At',
+    'scanned_by': 'Scanned By'
+}
+EXPORT_FETCH_SIZE = 2000
+
+def stream_passes_csv(columns, where, params):
+    """Yield CSV chunks straight from a DB cursor without materializing the table"""
+    conn = get_db(readonly=True)
+    try:
+        if is_postgres():
+            # Named cursor: rows stay on the server and arrive EXPORT_FETCH_SIZE at a time
+            cursor = conn.cursor(name='epass_export')
+            cursor.itersize = EXPORT_FETCH_SIZE
+        else:
+            cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT {", ".join(columns)} FROM passes WHERE {where} ORDER BY created_at DESC, pass_id DESC',
+            params
+        )
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([EXPORT_COLUMNS[c] for c in columns])
+        
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                writer.writerow(['' if row[c] is None else row[c] for c in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        
+        if buffer.tell():
+            yield buffer.getvalue()
+        cursor.close()
+    finally:
+        conn.close()
 
 @app.route('/export-csv')
 @login_required
 def export_csv():
-    """Export database to CSV"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM passes ORDER BY created_at DESC')
-    passes = cursor.fetchall()
-    conn.close()
+    """Export database to CSV (streams; accepts the /database filters and ?columns=)"""
+    requested = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+    columns = [c for c in requested if c in EXPORT_COLUMNS] or list(EXPORT_COLUMNS)
     
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Pass ID', 'Name 1', 'Phone 1', 'Name 2', 'Phone 2', 'Pass Type', 
-                     'Amount', 'Payment Mode', 'Transaction Info', 'Timing', 
-                     'Created At', 'Scanned At', 'Scanned By'])
-    
-    # Write data
-    for pass_data in passes:
-        writer.writerow([
-            pass_data['pass_id'],
-            pass_data['name1'],
-            pass_data['phone1'],
-            pass_data['name2'] or '',
-            pass_data['phone2'] or '',
-            pass_data['pass_type'],
-            pass_data['amount'],
-            pass_data['payment_mode'],
-            pass_data['txn_info'] or '',
-            pass_data['timing'],
-            pass_data['created_at'],
-            pass_data['scanned_at'] or '',
-            pass_data['scanned_by'] or ''
-        ])
+    where, params = pass_filters(
+        request.args.get('search', '').strip(),
+        request.args.get('scanned', ''),
+        request.args.get('type', '')
+    )
     
-    # Prepare download
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+    filename = f'epass_database_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    # Keeps the request context while rows stream: the query sees the session's
+    # read-your-writes pin, and its time counts toward this request's metrics
+    return Response(
+        stream_with_context(stream_passes_csv(columns, where, params)),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'epass_database_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
+class AssetManifest:
+    """Content fingerprints for files under static/, recomputed only when a file changes"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self, path):
+        """First 12 hex chars of the file's SHA-256, or '' if it does not exist"""
+        full_path = os.path.join(self.directory, path)
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+        except OSError:
+            return ''
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(full_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[path] = (mtime, digest)
+        return digest
+
+    @staticmethod
+    def split(filename):
+        """'js/scanner.<hash>.js' -> ('js/scanner.js', '<hash>'); unfingerprinted names get ''"""
+        directory, _, name = filename.rpartition('/')
+        parts = name.split('.')
+        if len(parts) >= 3 and re.fullmatch(r'[0-9a-f]{12}', parts[-2]):
+            name = '.'.join(parts[:-2] + parts[-1:])
+            return (f'{directory}/{name}' if directory else name), parts[-2]
+        return filename, ''
+
+    def url(self, path):
+        """Fingerprinted /assets/ URL; a missing vendored file falls back to its CDN URL"""
+        digest = self.fingerprint(path)
+        if not digest:
+            return VENDOR_ASSETS.get(path) or url_for('static', filename=path)
+        stem, dot, ext = path.rpartition('.')
+        return url_for('asset', filename=f'{stem}.{digest}.{ext}' if dot else f'{path}.{digest}')
+
+asset_manifest = AssetManifest(STATIC_DIR)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
+
+def encoded_variant(path):
+    """Best precompressed sibling of path the client accepts: (encoding, path) or (None, path)"""
+    if os.path.splitext(path)[1] not in COMPRESSIBLE_ASSETS:
+        return None, path
+    mtime = os.stat(path).st_mtime_ns
+    for encoding, suffix in ASSET_ENCODINGS:
+        if encoding not in request.accept_encodings:
+            continue
+        try:
+            # A variant older than its source is stale until the next build-assets
+            if os.stat(path + suffix).st_mtime_ns >= mtime:
+                return encoding, path + suffix
+        except OSError:
+            pass
+    return None, path
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Static asset by fingerprinted name; cached forever when the fingerprint is current"""
+    path, digest = AssetManifest.split(filename)
+    full_path = safe_join(STATIC_DIR, path)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    encoding, serve_path = encoded_variant(full_path)
+    mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    response = send_file(serve_path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if digest and digest == asset_manifest.fingerprint(path):
+        response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    else:
+        # Old or missing fingerprint (e.g. a page rendered before a deploy): revalidate
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def build_assets(directory=STATIC_DIR):
+    """Write .gz/.br siblings for compressible assets; returns the number of files written"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        # Also runs at gunicorn startup, so this goes to the log rather than the terminal
+        app.logger.warning('brotli not installed; writing gzip variants only')
+
+    compressors = {'.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['.br'] = lambda data: brotli.compress(data, quality=11)
+
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_ASSETS):
+                continue
+            path = os.path.join(root, name)
+            mtime = os.stat(path).st_mtime_ns
+            data = None
+            for suffix, compress in compressors.items():
+                target = path + suffix
+                try:
+                    if os.stat(target).st_mtime_ns >= mtime:
+                        continue
+                except OSError:
+                    pass
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    # Not worth a Content-Encoding; drop any stale variant
+                    if os.path.exists(target):
+                        os.remove(target)
+                    continue
+                RenderCache.store(target, compressed)
+                written += 1
+    return written
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Precompress static assets (gzip and, if installed, brotli)"""
+    click.echo(f'Wrote {build_assets()} compressed asset(s)')
+
+@app.cli.command('vendor-assets')
+def vendor_assets_command():
+    """Download the pinned third-party scripts into static/vendor"""
+    for path, source in VENDOR_ASSETS.items():
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target):
+            click.echo(f'{path}: present')
+            continue
+        with urllib.request.urlopen(source, timeout=30) as response:
+            data = response.read()
+        RenderCache.store(target, data)
+        click.echo(f'{path}: {len(data)} bytes from {source}')
+    click.echo(f'Wrote {build_assets()} compressed asset(s)')
+
+def scanner_shell_version():
+    """Changes whenever any precached asset or the scanner page templates change"""
+    material = [asset_manifest.url(path) for path in SCANNER_SHELL_ASSETS]
+    for template in ('base.html', 'scanner.html'):
+        with open(os.path.join(app.root_path, app.template_folder, template), 'rb') as f:
+            material.append(hashlib.sha256(f.read()).hexdigest())
+    return hashlib.sha256('\x1f'.join(material).encode('utf-8')).hexdigest()[:12]
+
+@app.route('/sw.js')
+def service_worker():
+    """Scanner service worker; served from the root so its scope covers /scanner"""
+    response = Response(
+        render_template(
+            'sw.js',
+            version=scanner_shell_version(),
+            shell_assets=[asset_manifest.url(path) for path in SCANNER_SHELL_ASSETS],
+            scanner_url=url_for('scanner')
+        ),
+        mimetype='application/javascript'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
@@ -556,15 +3204,30 @@ def health():
         cursor.execute("SELECT 1")
         conn.close()
         status["database"] = "healthy"
+        status["pool"] = db_pool_stats()
+        status["pass_cache"] = pass_cache.stats()
+        status["scan_events"] = scan_events.stats()
+        if READ_DATABASE_URL:
+            status["replica"] = replica_monitor.stats(READ_DATABASE_URL)
     except Exception as e:
         status["database"] = f"error: {str(e)}"
 
     return jsonify(status)
 
-
-with app.app_context():
-    init_db()
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, merged across workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == '__main__':
+    migrate()
+    pass_cache.warm_in_background()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,378 @@
+"""
+ASGI entry point for the Diwali E-Pass System
+
+The hot JSON endpoints (/api/scan, /api/stats, /health) run on an event loop
+with an async database driver (asyncpg for PostgreSQL, aiosqlite for SQLite),
+so a scan waiting on the database does not hold a worker or a thread. Every
+other route (admin pages, CSV, live stats stream, ...) is passed to the Flask
+app unchanged.
+
+QR verification, the gate cache, rate limiting, the stats cache and the
+response bodies are the same code the Flask views use.
+
+Usage:
+    flask --app app migrate
+    uvicorn asgi:app --workers 4
+or, with migrations applied by gunicorn.conf.py:
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.cookies import SimpleCookie
+
+from a2wsgi import WSGIMiddleware
+
+import app as epass
+
+ASGI_SQLITE_CONNECTIONS = int(os.environ.get('ASGI_SQLITE_CONNECTIONS', 4))
+ASGI_FLASK_THREADS = int(os.environ.get('ASGI_FLASK_THREADS', 8))
+ASGI_MAX_BODY = 64 * 1024
+
+def numbered_params(sql):
+    """psycopg2 %s placeholders -> asyncpg $1, $2, ..."""
+    counter = itertools.count(1)
+    return re.sub(r'%s', lambda _: f'${next(counter)}', sql)
+
+class AsyncPostgres:
+    """asyncpg pool running the same statements as the sync code"""
+
+    backend = 'asyncpg'
+
+    def __init__(self, url, max_size):
+        self.url = url
+        self.max_size = max_size
+        self._pool = None
+        self._claim_sql = numbered_params(epass.CLAIM_PASS_PG_SQL)
+        self._reread_sql = numbered_params(epass.REREAD_PASSES_PG_SQL)
+
+    async def open(self):
+        import asyncpg
+        self._pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.max_size, ssl='require')
+
+    async def close(self):
+        await self._pool.close()
+
+    async def claim(self, pass_id, username):
+        # One statement, so autocommit makes it atomic
+        row = await self._pool.fetchrow(self._claim_sql, None, username, pass_id, pass_id)
+        if not row:
+            return False, None
+        if not row['claimed'] and row['scanned_at'] is None:
+            # Lost to a concurrent claim (see epass.reread_lost_claims): a new statement sees it
+            row = await self._pool.fetchrow(self._reread_sql, [pass_id])
+            return False, row
+        return row['claimed'], row
+
+    async def stats_row(self):
+        return await self._pool.fetchrow(epass.STATS_SQL)
+
+    async def ping(self):
+        await self._pool.fetchval('SELECT 1')
+
+    def stats(self):
+        return {'backend': self.backend, 'max': self.max_size,
+                'open': self._pool.get_size(), 'idle': self._pool.get_idle_size()}
+
+class AsyncSQLite:
+    """A few aiosqlite connections (each runs on its own thread) handed out from a queue"""
+
+    backend = 'aiosqlite'
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._all = []
+
+    async def open(self):
+        import aiosqlite
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path, timeout=epass.DB_POOL_TIMEOUT)
+            conn.row_factory = sqlite3.Row
+            await conn.execute('PRAGMA journal_mode=WAL')
+            await conn.execute('PRAGMA synchronous=NORMAL')
+            self._all.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._all:
+            await conn.close()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def claim(self, pass_id, username):
+        async with self.connection() as conn:
+            try:
+                if epass.SQLITE_HAS_RETURNING:
+                    async with conn.execute(epass.CLAIM_PASS_SQLITE_SQL + ' RETURNING *', (None, username, pass_id)) as cursor:
+                        row = await cursor.fetchone()
+                    claimed = row is not None
+                else:
+                    cursor = await conn.execute(epass.CLAIM_PASS_SQLITE_SQL, (None, username, pass_id))
+                    claimed = cursor.rowcount == 1
+                    row = None
+                if row is None:
+                    async with conn.execute('SELECT * FROM passes WHERE pass_id = ?', (pass_id,)) as cursor:
+                        row = await cursor.fetchone()
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        return claimed, row
+
+    async def stats_row(self):
+        async with self.connection() as conn:
+            async with conn.execute(epass.STATS_SQL) as cursor:
+                return await cursor.fetchone()
+
+    async def ping(self):
+        async with self.connection() as conn:
+            await conn.execute('SELECT 1')
+
+    def stats(self):
+        return {'backend': self.backend, 'open': len(self._all), 'idle': self._idle.qsize()}
+
+class AsyncCoalescer:
+    """Event-loop version of RequestCoalescer: identical requests share one result"""
+
+    def __init__(self, window, max_entries=10000):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def run(self, key, fn):
+        """Returns (result, shared) like RequestCoalescer.run"""
+        loop = asyncio.get_running_loop()
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires'] > loop.time():
+            result = await asyncio.shield(entry['future'])
+            if result is not None:
+                return result, True
+            # The first request failed: do the work ourselves
+            return await fn(), False
+
+        entry = {'expires': float('inf'), 'future': loop.create_future()}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        result = None
+        try:
+            result = await fn()
+        finally:
+            entry['expires'] = loop.time() + self.window
+            entry['future'].set_result(result)
+        return result, False
+
+db = None
+scan_coalescer = AsyncCoalescer(epass.SCAN_COALESCE_WINDOW)
+_stats_lock = None
+
+async def startup():
+    global db, _stats_lock
+    if epass.is_postgres():
+        db = AsyncPostgres(epass.DATABASE_URL, epass.DB_POOL_MAX)
+    else:
+        db = AsyncSQLite(epass.DATABASE_URL, ASGI_SQLITE_CONNECTIONS)
+    await db.open()
+    _stats_lock = asyncio.Lock()
+    epass.pass_cache.warm_in_background()
+
+async def shutdown():
+    # The scan event writer is a thread using the sync pool; let it drain first
+    await asyncio.to_thread(epass.scan_events.flush)
+    await db.close()
+
+def session_user(scope):
+    """Username from Flask's signed session cookie, or None"""
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(epass.app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    serializer = epass.app.session_interface.get_signing_serializer(epass.app)
+    try:
+        data = serializer.loads(morsel.value, max_age=int(epass.app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    return data.get('username')
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def read_body(receive):
+    """Request body, or None if it is larger than ASGI_MAX_BODY"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def send_json(send, body, status=200, headers=None):
+    data = epass.app.json.dumps(body).encode('utf-8') + b'\n'
+    raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': data})
+
+async def redirect_to_login(send):
+    await send({'type': 'http.response.start', 'status': 302,
+                'headers': [(b'location', b'/login'), (b'content-length', b'0')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def timed_query(awaitable):
+    """Await a database call, adding it to the request's database totals like timed_db_call"""
+    totals = epass.request_db_time.get()
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += time.perf_counter() - start
+
+async def scan(qr_payload, username):
+    pass_id, answered = epass.scan_precheck(qr_payload)
+    if answered:
+        return pass_id, answered
+    claimed, row = await timed_query(db.claim(pass_id, username))
+    return pass_id, epass.scan_outcome(pass_id, claimed, row)
+
+async def api_scan(scope, receive, send):
+    username = session_user(scope)
+    if not username:
+        return await redirect_to_login(send)
+    device = (header(scope, b'x-scanner-id') or (scope.get('client') or ('',))[0])[:64]
+
+    allowed, retry_after = epass.scan_limiter.allow((username, device))
+    if not allowed:
+        body, status, headers = epass.rate_limited_result(device, retry_after)
+        epass.log_scan_event(epass.count_scan_outcome('scan', body, status), None, username, device)
+        return await send_json(send, body, status, headers)
+
+    raw = await read_body(receive)
+    if raw is None:
+        return await send_json(send, {'status': 'error', 'message': 'Request too large'}, 413)
+    try:
+        data = epass.app.json.loads(raw) if raw else None
+    except ValueError:
+        data = None
+    qr_payload = epass.scan_request_payload(data)
+
+    (pass_id, (body, status)), shared = await scan_coalescer.run(
+        (username, device, qr_payload),
+        lambda: scan(qr_payload, username)
+    )
+    if shared and body['status'] == 'success':
+        # Only one request admits the guest; repeats are answered from the pass cache
+        pass_id, (body, status) = await scan(qr_payload, username)
+    epass.log_scan_event(epass.count_scan_outcome('scan', body, status), pass_id, username, device)
+    await send_json(send, body, status)
+
+async def api_stats(scope, receive, send):
+    if not session_user(scope):
+        return await redirect_to_login(send)
+    stats = epass.fresh_stats()
+    if stats is None:
+        async with _stats_lock:
+            stats = epass.fresh_stats()
+            if stats is None:
+                stats = epass.stats_from_row(await timed_query(db.stats_row()))
+                epass.store_stats(stats)
+    await send_json(send, stats)
+
+async def health(scope, receive, send):
+    status = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "status": "ok",
+        "database": None
+    }
+    try:
+        await timed_query(db.ping())
+        status["database"] = "healthy"
+        status["pool"] = db.stats()
+        status["pass_cache"] = epass.pass_cache.stats()
+    except Exception as e:
+        status["database"] = f"error: {str(e)}"
+    await send_json(send, status)
+
+ROUTES = {
+    ('POST', '/api/scan'): api_scan,
+    ('GET', '/api/stats'): api_stats,
+    ('GET', '/health'): health,
+}
+
+async def instrumented(handler, scope, receive, send):
+    """Request metrics for the async routes, as the Flask request hooks record them"""
+    start = time.perf_counter()
+    totals = [0, 0.0]
+    epass.request_db_time.set(totals)
+    response = {'status': 500}
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        await send(message)
+
+    try:
+        await handler(scope, receive, send_with_status)
+    finally:
+        route = scope['path']
+        epass.REQUEST_LATENCY.labels(route, scope['method'], response['status']).observe(time.perf_counter() - start)
+        epass.REQUEST_DB_QUERIES.labels(route).observe(totals[0])
+        epass.REQUEST_DB_SECONDS.labels(route).observe(totals[1])
+        pool = db.stats()
+        epass.DB_CONNECTIONS.labels('open').set(pool['open'])
+        epass.DB_CONNECTIONS.labels('in_use').set(pool['open'] - pool['idle'])
+
+flask_app = WSGIMiddleware(epass.app, workers=ASGI_FLASK_THREADS)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        handler = ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            return await instrumented(handler, scope, receive, send)
+    await flask_app(scope, receive, send)
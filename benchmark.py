@@ -0,0 +1,702 @@
+"""
+Benchmarks for the Diwali E-Pass System
+
+Runs against a throwaway SQLite file by default. Pass --database-url to run
+against a scratch PostgreSQL database (it will be seeded with test passes).
+
+Usage:
+    python benchmark.py search --passes 100000
+    python benchmark.py qr
+    python benchmark.py login --logins 32
+    python benchmark.py startup
+    python benchmark.py load --connections 64
+    python benchmark.py gate --baseline bench-baseline.json
+    python benchmark.py events --events 100000
+"""
+import argparse
+import json
+import logging
+import threading
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import app as epass
+
+SYLLABLES = ['a', 'ra', 'vi', 'ka', 'sha', 'an', 'ya', 'ro', 'han', 'pri', 'dev', 'ish',
+             'mee', 'ni', 'kab', 'ir', 'di', 'tya', 'su', 'jo', 'sé', 'rè', 'zo', 'ë']
+LAST_NAMES = ['Sharma', 'Verma', 'Mehta', 'Iyer', 'Khurana', 'Gupta', 'Nair', 'Reddy',
+              'Dubois', 'García', 'Kapoor', 'Singh', 'Joshi', 'Malhotra', 'Bose', 'Das']
+TIMINGS = ['7 PM - 9 PM', '9 PM - 11 PM', '11 PM - 1 AM']
+
+def use_database(database_url):
+    """Point the app at database_url, or a fresh temp SQLite file"""
+    if not database_url:
+        tmpdir = tempfile.mkdtemp(prefix='epass-bench-')
+        database_url = os.path.join(tmpdir, 'bench.db')
+    epass.DATABASE_URL = database_url
+    epass.init_db()
+    return database_url
+
+def random_name():
+    """Synthetic first + last name, varied enough that searches are selective"""
+    first = ''.join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4)))
+    return f'{first.capitalize()} {random.choice(LAST_NAMES)}'
+
+def random_pass(n):
+    """Row tuple for a synthetic pass"""
+    couple = n % 3 == 0
+    return (
+        str(uuid.uuid4()),
+        random_name(),
+        f'9{n:09d}',
+        random_name() if couple else None,
+        f'8{n:09d}' if couple else None,
+        'COUPLE' if couple else 'SINGLE',
+        epass.PRICE_COUPLE if couple else epass.PRICE_SINGLE,
+        random.choice(['CASH', 'ONLINE']),
+        random.choice(TIMINGS),
+    )
+
+def seed_passes(count, chunk=5000):
+    """Bulk insert count synthetic passes"""
+    param = epass.sql_param()
+    sql = f'''
+        INSERT INTO passes (pass_id, name1, phone1, name2, phone2, pass_type, amount, payment_mode, timing)
+        VALUES ({', '.join([param] * 9)})
+    '''
+    conn = epass.get_db()
+    cursor = conn.cursor()
+    for start in range(0, count, chunk):
+        cursor.executemany(sql, [random_pass(n) for n in range(start, min(start + chunk, count))])
+        conn.commit()
+    conn.close()
+
+def timed(fn, repeat):
+    """Run fn repeat times; return per-call milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f'  {label:<28} median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms')
+    return statistics.median(samples)
+
+def run_listing(where, params, per_page=20):
+    """COUNT plus first page, the way /database queries"""
+    conn = epass.get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COUNT(*) AS count FROM passes WHERE {where}', params)
+    cursor.fetchone()
+    param = epass.sql_param()
+    cursor.execute(f'SELECT * FROM passes WHERE {where} ORDER BY created_at DESC LIMIT {param}', params + [per_page])
+    cursor.fetchall()
+    conn.close()
+
+def legacy_search(term):
+    """The original four-column leading-wildcard LIKE"""
+    param = epass.sql_param()
+    like = f'%{term}%'
+    return f'(name1 LIKE {param} OR phone1 LIKE {param} OR name2 LIKE {param} OR phone2 LIKE {param})', [like] * 4
+
+def bench_search(args):
+    database_url = use_database(args.database_url)
+    print(f'Seeding {args.passes} passes into {database_url} ...')
+    start = time.perf_counter()
+    seed_passes(args.passes)
+    print(f'  seeded in {time.perf_counter() - start:.1f}s')
+
+    # Real names from the seeded data: full names, first names and 3-letter prefixes
+    conn = epass.get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT name1 FROM passes ORDER BY pass_id LIMIT 3')
+    names = [row['name1'] for row in cursor.fetchall()]
+    conn.close()
+    terms = [names[0], names[1].split()[0], names[2][:3], 'garcia', '9000012', '98765']
+
+    print(f'Search: COUNT + first page, {args.repeat} runs per term')
+    for term in terms:
+        print(f'"{term}"')
+        legacy = report('legacy LIKE', timed(lambda: run_listing(*legacy_search(term)), args.repeat))
+        indexed = report('indexed', timed(lambda: run_listing(*epass.pass_filters(term)), args.repeat))
+        print(f'  {"speedup":<28} {legacy / indexed:8.1f}x')
+
+def ops_per_second(fn, items):
+    """Call fn on every item; return calls per second"""
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+def bench_qr(args):
+    pass_ids = [str(uuid.uuid4()) for _ in range(args.count)]
+    formats = [('legacy', epass.generate_legacy_qr_payload), ('compact', epass.generate_qr_payload)]
+
+    print(f'QR payload encode/verify, {args.count} pass IDs')
+    for label, encode in formats:
+        payloads = [encode(pass_id) for pass_id in pass_ids]
+        encode_rate = ops_per_second(encode, pass_ids)
+        verify_rate = ops_per_second(epass.verify_qr_payload, payloads)
+        print(f'  {label:<8} encode {encode_rate:10,.0f}/s   verify {verify_rate:10,.0f}/s')
+
+    print('QR symbol (error correction H)')
+    for label, encode in formats:
+        payload = encode(pass_ids[0])
+        qr = epass.make_qr(payload)
+        width, _ = qr.symbol_size(border=0)
+        png = len(epass.render_qr(payload, 'png'))
+        svg = len(epass.render_qr(payload, 'svg'))
+        print(f'  {label:<8} {len(payload):3d} chars  {qr.mode:<12} version {qr.version:>2}  '
+              f'{width}x{width} modules  PNG {png:,} B  SVG {svg:,} B')
+
+def login_burst(logins, threads, probe_interval):
+    """Fire a burst of logins into a pool the size of one gthread worker while
+    probing /health; returns (probe latencies in ms, login status codes)"""
+    client = epass.app.test_client()
+    pool = ThreadPoolExecutor(max_workers=threads)
+    probes = []
+    done = threading.Event()
+
+    def probe():
+        start = time.perf_counter()
+        client.get('/health')
+        return (time.perf_counter() - start) * 1000
+
+    def login(n):
+        return epass.app.test_client().post('/login', data={
+            'username': f'admin{n % 5 + 1}', 'password': 'diwaliparty@123'
+        }).status_code
+
+    logins_done = [pool.submit(login, n) for n in range(logins)]
+    threading.Thread(target=lambda: ([f.result() for f in logins_done], done.set())).start()
+    while not done.is_set():
+        # Queue a probe behind whatever the worker threads are doing, like a scan would be
+        submitted = time.perf_counter()
+        future = pool.submit(probe)
+        future.result()
+        probes.append((time.perf_counter() - submitted) * 1000)
+        time.sleep(probe_interval)
+    pool.shutdown()
+    return probes, [f.result() for f in logins_done]
+
+def bench_login(args):
+    epass.BCRYPT_ROUNDS = args.rounds
+    use_database(args.database_url)
+    idle = timed(lambda: epass.app.test_client().get('/health'), 50)
+    print(f'bcrypt cost {args.rounds}, {args.logins} logins into {args.threads} request threads')
+    report('/health idle', idle)
+
+    pooled_check = epass.check_password
+    modes = [
+        ('inline bcrypt', lambda password, password_hash: bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))),
+        ('bcrypt executor', pooled_check),
+    ]
+    for label, check in modes:
+        epass.check_password = check
+        start = time.perf_counter()
+        probes, statuses = login_burst(args.logins, args.threads, args.probe_interval)
+        elapsed = time.perf_counter() - start
+        print(f'{label}: burst took {elapsed:.1f}s, {statuses.count(302)} logged in, '
+              f'{statuses.count(503)} asked to retry')
+        report('/health during burst', probes)
+    epass.check_password = pooled_check
+
+# What each worker did at import before migrations moved out: the whole schema
+# script plus a bcrypt hash for the admin seed
+LEGACY_BOOT = """
+import app
+with app.app.app_context():
+    conn = app.get_db()
+    cursor = conn.cursor()
+    for _, _, apply in app.MIGRATIONS:
+        apply(cursor, app.is_postgres())
+    app.hash_password('diwaliparty@123')
+    conn.commit()
+    conn.close()
+"""
+
+def time_python(code, database_url, repeat):
+    """Wall-clock milliseconds for a fresh interpreter running code"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, cwd=cwd, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def bench_startup(args):
+    database_url = use_database(args.database_url)
+    print(f'Worker boot: fresh interpreter importing the app, {args.repeat} runs')
+    baseline = report('python -c pass', time_python('pass', database_url, args.repeat))
+    legacy = report('legacy boot (schema + seed)', time_python(LEGACY_BOOT, database_url, args.repeat))
+    current = report('import app (no DB I/O)', time_python('import app', database_url, args.repeat))
+    print(f'  {"per-worker saving":<28} {legacy - current:8.1f} ms ({(legacy - baseline) / (current - baseline):.1f}x less app start-up)')
+    report('flask migrate, up to date', timed(epass.migrate, args.repeat))
+
+class CountingCursor:
+    """Cursor proxy counting statements sent to the database"""
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args):
+        self._counter.n += 1
+        return self._cursor.execute(*args)
+
+    def executemany(self, *args):
+        self._counter.n += 1
+        return self._cursor.executemany(*args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingConnection:
+    """get_db() connection proxy: statements and commits are database round trips"""
+
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+
+    def execute(self, *args):
+        self._counter.n += 1
+        return self._conn.execute(*args)
+
+    def commit(self):
+        self._counter.n += 1
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def count_round_trips():
+    """Route get_db() through CountingConnection; returns the per-thread counter"""
+    counter = threading.local()
+    get_db = epass.get_db
+
+    def counting_get_db(**kwargs):
+        conn = get_db(**kwargs)
+        # Only request threads are counted (not e.g. the scan event writer)
+        return CountingConnection(conn, counter) if hasattr(counter, 'n') else conn
+
+    epass.get_db = counting_get_db
+    return counter
+
+def import_seed(count):
+    """Create count passes through the CSV import path (validation + chunked inserts)"""
+    import csv
+    import io
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['name1', 'phone1', 'name2', 'phone2', 'pass_type', 'timing', 'payment_mode', 'txn_info'])
+    for n in range(count):
+        _, name1, phone1, name2, phone2, pass_type, _, payment_mode, timing = random_pass(n)
+        writer.writerow([name1, phone1, name2 or '', phone2 or '', pass_type, timing, payment_mode, ''])
+    buffer.seek(0)
+    report = epass.import_passes(buffer)
+    assert report['imported'] == count, report
+
+def gate_scripts(pass_ids, scanners, duplicate_rate, return_rate, invalid_rate):
+    """Per-scanner request lists: guests arrive in groups of 1-6; a camera often decodes the
+    same frame more than once; some guests come back through another gate; some QR codes are
+    forged or damaged. Returns (scripts, number of guests admitted)"""
+    scripts = [[] for _ in range(scanners)]
+    guests = list(pass_ids)
+    random.shuffle(guests)
+    admitted = []
+    while guests:
+        gate = random.randrange(scanners)
+        for _ in range(min(random.randint(1, 6), len(guests))):
+            pass_id = guests.pop()
+            payload = epass.generate_qr_payload(pass_id)
+            scripts[gate].append(('scan', payload))
+            admitted.append(pass_id)
+            while random.random() < duplicate_rate:
+                scripts[gate].append(('scan', payload))
+            if random.random() < invalid_rate:
+                scripts[gate].append(('invalid', payload[:-4] + 'AAAA'))
+            if random.random() < return_rate:
+                scripts[random.randrange(scanners)].append(('return', payload))
+    return scripts, len(admitted)
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def bench_gate(args):
+    random.seed(args.seed)
+    database_url = use_database(args.database_url)
+    print(f'Seeding {args.passes} passes through the CSV import into {database_url} ...')
+    start = time.perf_counter()
+    import_seed(args.passes)
+    print(f'  seeded in {time.perf_counter() - start:.1f}s')
+    conn = epass.get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT pass_id, name1 FROM passes')
+    rows = cursor.fetchall()
+    conn.close()
+    pass_ids = [row['pass_id'] for row in rows]
+    search_terms = [random.choice(rows)['name1'].split()[0][:4] for _ in range(20)] + ['9000', 'Sharma']
+
+    logging.getLogger('epass.scan').disabled = True
+    # Simulated scanners send far faster than a real camera; measure the server, not the limiter
+    epass.scan_limiter = epass.TokenBucketLimiter(1e9, 1e9)
+    counter = count_round_trips()
+    samples = {}
+    trips = {}
+    statuses = {}
+    lock = threading.Lock()
+
+    def client():
+        client = epass.app.test_client()
+        with client.session_transaction() as sess:
+            sess['username'] = 'admin1'
+        return client
+
+    def record(kind, fn):
+        counter.n = 0
+        start = time.perf_counter()
+        response = fn()
+        response.data
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            samples.setdefault(kind, []).append(elapsed)
+            trips.setdefault(kind, []).append(counter.n)
+            statuses.setdefault(kind, {}).setdefault(response.status_code, 0)
+            statuses[kind][response.status_code] += 1
+        return response
+
+    contended = pass_ids[:args.contended]
+    scripts, admitted = gate_scripts(pass_ids[args.contended:], args.scanners,
+                                     args.duplicate_rate, args.return_rate, args.invalid_rate)
+    barrier = threading.Barrier(args.scanners)
+    done = threading.Event()
+
+    def scanner(n):
+        c = client()
+        device = {'X-Scanner-Id': f'gate-{n}'}
+        # Everybody scans the same passes at the same instant first
+        for pass_id in contended:
+            barrier.wait()
+            record('contended', lambda: c.post('/api/scan', json={'payload': epass.generate_qr_payload(pass_id)}, headers=device))
+        for kind, payload in scripts[n]:
+            record(kind, lambda: c.post('/api/scan', json={'payload': payload}, headers=device))
+
+    def admin():
+        c = client()
+        n = 0
+        while not done.is_set():
+            if n % args.export_every == args.export_every - 1:
+                record('export-csv', lambda: c.get('/export-csv'))
+            else:
+                record('search', lambda: c.get('/database', query_string={'search': random.choice(search_terms)}))
+            n += 1
+
+    total_scans = sum(len(script) for script in scripts) + len(contended) * args.scanners
+    print(f'{args.scanners} scanners, {total_scans} scan requests ({admitted} guests, '
+          f'{args.contended} passes scanned by every gate at once), {args.admins} admin sessions')
+    admins = [threading.Thread(target=admin) for _ in range(args.admins)]
+    for thread in admins:
+        thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.scanners) as pool:
+        list(pool.map(scanner, range(args.scanners)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in admins:
+        thread.join()
+
+    # One success per guest and per contended pass; everything else was turned away
+    successes = sum(statuses.get(kind, {}).get(200, 0) for kind in ('scan', 'contended', 'return'))
+    assert successes == admitted + len(contended), (successes, admitted, statuses)
+    assert statuses.get('contended', {}).get(200, 0) == len(contended), statuses['contended']
+    assert set(statuses.get('invalid', {400: 0})) == {400}, statuses['invalid']
+
+    results = {'scan_rps': round(total_scans / elapsed, 1)}
+    print(f'  {"kind":<12} {"requests":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"trips/req":>9}  statuses')
+    for kind in ('scan', 'return', 'invalid', 'contended', 'search', 'export-csv'):
+        if kind not in samples:
+            continue
+        values = samples[kind]
+        round_trips = sum(trips[kind]) / len(trips[kind])
+        print(f'  {kind:<12} {len(values):8d} {percentile(values, 0.5):8.2f} {percentile(values, 0.95):8.2f} '
+              f'{percentile(values, 0.99):8.2f} {round_trips:9.2f}  {dict(sorted(statuses[kind].items()))}')
+        results[f'{kind}_p95_ms'] = round(percentile(values, 0.95), 2)
+        results[f'{kind}_p99_ms'] = round(percentile(values, 0.99), 2)
+        results[f'{kind}_round_trips'] = round(round_trips, 3)
+    print(f'  {"scan throughput":<28} {results["scan_rps"]:8.1f} req/s over {elapsed:.1f}s')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, args.threshold)
+        for line in regressions:
+            print(f'  REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.0%} of {args.baseline}')
+
+# Metrics stable enough to gate on: p99 of a few hundred samples and round trips of racing
+# scans (who claims first) move from run to run
+GATED_METRICS = ['scan_rps', 'scan_p95_ms', 'search_p95_ms',
+                 'scan_round_trips', 'invalid_round_trips', 'search_round_trips', 'export-csv_round_trips']
+
+def compare_baseline(results, baseline, threshold):
+    """Gated metrics that got worse than baseline by more than threshold (a fraction)"""
+    regressions = []
+    for key in GATED_METRICS:
+        old = baseline.get(key)
+        new = results.get(key)
+        if old is None or new is None:
+            continue
+        if key.endswith('_rps'):
+            worse = new < old * (1 - threshold)
+        else:
+            # Round trips are deterministic; allow a tiny absolute slack for the averages
+            slack = 0.01 if key.endswith('_round_trips') else 0
+            worse = new > old * (1 + threshold) + slack
+        if worse:
+            regressions.append(f'{key}: {old} -> {new}')
+    return regressions
+
+# Servers compared by the load test; {workers} and {port} are filled in
+LOAD_SERVERS = [
+    ('sync', ['-k', 'sync', 'app:app']),
+    ('gthread x8', ['-k', 'gthread', '--threads', '8', 'app:app']),
+    ('asgi (uvicorn)', ['-k', 'uvicorn.workers.UvicornWorker', 'asgi:app']),
+]
+
+def start_server(worker_args, database_url, workers, port):
+    """Start gunicorn on port and wait until /health answers"""
+    import urllib.request
+    env = dict(os.environ, DATABASE_URL=database_url, SCAN_RATE='1000000', SCAN_BURST='1000000')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning'] + worker_args,
+        env=env, cwd=cwd
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('server did not start')
+
+async def http_client(port, jobs, cookie, scanner, latencies, statuses):
+    """One keep-alive HTTP/1.1 connection working through the shared job list"""
+    import asyncio
+    reader = writer = None
+    while jobs:
+        method, path, body = jobs.pop()
+        request = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: session={cookie}\r\n'
+                   f'X-Scanner-Id: {scanner}\r\nContent-Type: application/json\r\n'
+                   f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+        start = time.perf_counter()
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses.append(int(lines[0].split()[1]))
+        if headers.get('connection') == 'close' or 'content-length' not in headers:
+            # Sync workers do not keep connections alive
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+def load_jobs(pass_ids, requests):
+    """Gate-like mix: 70% first scans, 20% re-presented passes, 10% dashboard stats"""
+    import json
+    fresh = list(pass_ids)
+    random.shuffle(fresh)
+    used = []
+    jobs = []
+    for _ in range(requests):
+        roll = random.random()
+        if roll < 0.1:
+            jobs.append(('GET', '/api/stats', b''))
+            continue
+        if roll < 0.3 and used:
+            pass_id = random.choice(used)
+        elif fresh:
+            pass_id = fresh.pop()
+            used.append(pass_id)
+        else:
+            pass_id = random.choice(used)
+        jobs.append(('POST', '/api/scan', json.dumps({'payload': epass.generate_qr_payload(pass_id)}).encode()))
+    jobs.reverse()
+    return jobs
+
+def bench_load(args):
+    import asyncio
+    database_url = use_database(args.database_url)
+    seed_passes(args.passes)
+    conn = epass.get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT pass_id FROM passes')
+    pass_ids = [row['pass_id'] for row in cursor.fetchall()]
+    conn.close()
+    cookie = epass.app.session_interface.get_signing_serializer(epass.app).dumps({'username': 'admin1'})
+    print(f'{args.requests} requests over {args.connections} connections, {args.workers} workers, '
+          f'{args.passes} passes')
+
+    for label, worker_args in LOAD_SERVERS:
+        conn = epass.get_db()
+        conn.cursor().execute('UPDATE passes SET scanned_at = NULL, scanned_by = NULL')
+        conn.commit()
+        conn.close()
+        server = start_server(worker_args, database_url, args.workers, args.port)
+        try:
+            jobs = load_jobs(pass_ids, args.requests)
+            latencies, statuses = [], []
+            start = time.perf_counter()
+
+            async def run():
+                await asyncio.gather(*[
+                    http_client(args.port, jobs, cookie, f'load-{n}', latencies, statuses)
+                    for n in range(args.connections)
+                ])
+            asyncio.run(run())
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        errors = sum(1 for s in statuses if s >= 500 or s == 429)
+        print(f'  {label:<16} {len(latencies) / elapsed:8.0f} req/s   p50 {p50:7.2f} ms   '
+              f'p99 {p99:7.2f} ms   {statuses.count(200)} ok, {errors} errors')
+
+def bench_events(args):
+    """Sustained scan_events ingest: producers record as fast as they can, the writer keeps up or drops"""
+    use_database(args.database_url)
+    pass_ids = [str(uuid.uuid4()) for _ in range(1000)]
+    outcomes = ['success', 'already_scanned', 'already_scanned', 'invalid', 'not_found']
+    per_thread = args.events // args.threads
+    configs = [('commit per event', 0, 1)] + [(f'group {ms:g} ms / {args.batch}', ms, args.batch) for ms in args.flush_ms]
+
+    print(f'Scan event ingest, {per_thread * args.threads:,} events from {args.threads} threads')
+    for label, flush_ms, batch in configs:
+        writer = epass.ScanEventWriter(flush_ms / 1000, batch, epass.SCAN_EVENT_QUEUE)
+        record_us = []
+
+        def produce(n):
+            samples = []
+            for i in range(per_thread):
+                start = time.perf_counter()
+                writer.record(pass_ids[i % len(pass_ids)], f'gate-{n}', 'admin1', outcomes[i % len(outcomes)])
+                samples.append((time.perf_counter() - start) * 1e6)
+            record_us.extend(samples)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        writer.flush(timeout=600)
+        elapsed = time.perf_counter() - start
+
+        stats = writer.stats()
+        record_us.sort()
+        print(f'  {label:<24} {stats["written"] / elapsed:10,.0f} events/s written   '
+              f'{stats["commits"]:6,} commits (avg {stats["written"] / max(stats["commits"], 1):6.1f})   '
+              f'{stats["dropped"]:7,} dropped   record() p99 {record_us[int(len(record_us) * 0.99)]:6.1f} µs')
+
+def main():
+    parser = argparse.ArgumentParser(description='E-Pass benchmarks')
+    parser.add_argument('--database-url', help='scratch database to use (default: temp SQLite file)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help='/database search: legacy LIKE vs indexed')
+    search.add_argument('--passes', type=int, default=100000)
+    search.add_argument('--repeat', type=int, default=20)
+    search.set_defaults(func=bench_search)
+
+    qr = commands.add_parser('qr', help='QR payload encode/verify speed and symbol size, legacy vs compact')
+    qr.add_argument('--count', type=int, default=20000)
+    qr.set_defaults(func=bench_qr)
+
+    login = commands.add_parser('login', help='request latency during a login burst, inline vs executor bcrypt')
+    login.add_argument('--logins', type=int, default=32)
+    login.add_argument('--threads', type=int, default=8, help='request threads per worker (gunicorn --threads)')
+    login.add_argument('--rounds', type=int, default=epass.BCRYPT_ROUNDS)
+    login.add_argument('--probe-interval', type=float, default=0.05)
+    login.set_defaults(func=bench_login)
+
+    startup = commands.add_parser('startup', help='worker boot time with and without schema work at import')
+    startup.add_argument('--repeat', type=int, default=10)
+    startup.set_defaults(func=bench_startup)
+
+    gate = commands.add_parser('gate', help='event-night gate traffic with admin searches/exports; optional regression gate')
+    gate.add_argument('--passes', type=int, default=5000)
+    gate.add_argument('--scanners', type=int, default=8)
+    gate.add_argument('--admins', type=int, default=1)
+    gate.add_argument('--contended', type=int, default=20, help='passes every scanner scans at the same moment')
+    gate.add_argument('--duplicate-rate', type=float, default=0.3, help='chance a camera decodes the same frame again')
+    gate.add_argument('--return-rate', type=float, default=0.1, help='chance a guest is scanned again at another gate')
+    gate.add_argument('--invalid-rate', type=float, default=0.03, help='chance of a damaged or forged QR code')
+    gate.add_argument('--export-every', type=int, default=10, help='admin runs an export every N requests')
+    gate.add_argument('--seed', type=int, default=1)
+    gate.add_argument('--save-baseline', metavar='FILE', help='write the results as a baseline JSON file')
+    gate.add_argument('--baseline', metavar='FILE', help='exit 1 if results regress from this baseline')
+    gate.add_argument('--threshold', type=float, default=0.25, help='allowed regression as a fraction')
+    gate.set_defaults(func=bench_gate)
+
+    load = commands.add_parser('load', help='scan/stats API throughput and latency: sync vs gthread vs ASGI workers')
+    load.add_argument('--passes', type=int, default=5000)
+    load.add_argument('--requests', type=int, default=5000)
+    load.add_argument('--connections', type=int, default=64)
+    load.add_argument('--workers', type=int, default=2)
+    load.add_argument('--port', type=int, default=8517)
+    load.set_defaults(func=bench_load)
+
+    events = commands.add_parser('events', help='scan event log ingest rate: commit per event vs group commit')
+    events.add_argument('--events', type=int, default=100000)
+    events.add_argument('--threads', type=int, default=8)
+    events.add_argument('--batch', type=int, default=epass.SCAN_EVENT_BATCH)
+    events.add_argument('--flush-ms', type=float, nargs='+', default=[1, epass.SCAN_EVENT_FLUSH_MS, 20])
+    events.set_defaults(func=bench_events)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Gunicorn settings for the Diwali E-Pass System (picked up automatically from
+the working directory)
+
+Schema migrations run once in the master before any worker starts, so
+workers boot without touching the database.
+
+The worker thread count is passed to the app as WEB_THREADS, which caps how
+many live dashboard streams a worker holds open. Static assets are
+precompressed here too (see `flask build-assets`). Each worker warms its gate
+cache of scanned passes in the background as soon as it has loaded the app,
+so the first scans after a restart do not wait for that query.
+
+Workers write Prometheus samples to PROMETHEUS_MULTIPROC_DIR, which /metrics
+merges; it is emptied at start-up and dead workers' gauges are dropped.
+"""
+import os
+import tempfile
+
+# Must be set before the app (and prometheus_client) is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'epass-metrics'))
+
+def on_starting(server):
+    # Sizes the app's per-worker stream limits; set before the app is first imported
+    os.environ.setdefault('WEB_THREADS', str(server.cfg.threads))
+
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
+    from app import migrate, close_pools, build_assets
+    applied = migrate()
+    server.log.info('Database migrations applied: %s', ', '.join(applied) or 'none pending')
+    server.log.info('Compressed static assets written: %d', build_assets())
+    # Workers must not inherit the master's database connections
+    close_pools()
+
+def post_worker_init(worker):
+    from app import pass_cache
+    pass_cache.warm_in_background()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
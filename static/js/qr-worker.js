@@ -0,0 +1,47 @@
+// QR decoding off the main thread. The scanner page posts one frame at a time,
+// either an ImageBitmap (drawn here on an OffscreenCanvas) or raw RGBA pixels in
+// a transferred ArrayBuffer, and gets the payload and decode time back. Pixel
+// buffers are transferred back so the page can reuse them for the next frame.
+let canvas = null;
+let context = null;
+
+function pixelsFromBitmap(bitmap) {
+    if (!canvas || canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+        canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+        context = canvas.getContext('2d', { willReadFrequently: true });
+    }
+    context.drawImage(bitmap, 0, 0);
+    bitmap.close();
+    return context.getImageData(0, 0, canvas.width, canvas.height).data;
+}
+
+self.onmessage = (event) => {
+    const message = event.data;
+    if (message.type === 'init') {
+        importScripts(message.jsqr);
+        self.postMessage({ type: 'ready' });
+        return;
+    }
+
+    const started = performance.now();
+    let pixels, buffer = null;
+    if (message.bitmap) {
+        pixels = pixelsFromBitmap(message.bitmap);
+    } else {
+        buffer = message.buffer;
+        pixels = new Uint8ClampedArray(buffer);
+    }
+    const code = jsQR(pixels, message.width, message.height, { inversionAttempts: 'dontInvert' });
+
+    self.postMessage({
+        type: 'result',
+        id: message.id,
+        region: message.region,
+        width: message.width,
+        height: message.height,
+        sentAt: message.sentAt,
+        data: code ? code.data : null,
+        ms: performance.now() - started,
+        buffer: buffer
+    }, buffer ? [buffer] : []);
+};
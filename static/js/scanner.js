@@ -0,0 +1,600 @@
+// QR scanner page: camera decoding, online/offline verification and the offline scan queue
+const scannerContainer = document.getElementById('scanner-container');
+const SCANNER_USER = scannerContainer.dataset.username;
+const video = document.getElementById('video');
+const modal = document.getElementById('result-modal');
+const modalContent = document.getElementById('modal-content');
+const modalIcon = document.getElementById('modal-icon');
+const modalTitle = document.getElementById('modal-title');
+const modalMessage = document.getElementById('modal-message');
+const passInfo = document.getElementById('pass-info');
+const scannerStatus = document.getElementById('scanner-status');
+const successCount = document.getElementById('success-count');
+const errorCount = document.getElementById('error-count');
+
+let successScans = 0;
+let errorScans = 0;
+let isScanning = false;
+
+// Start camera
+navigator.mediaDevices.getUserMedia({ 
+    video: { facingMode: 'environment' } 
+}).then(function(stream) {
+    video.srcObject = stream;
+    video.setAttribute('playsinline', true);
+    video.play();
+    startDecoder();
+}).catch(function(err) {
+    console.error('Camera error:', err);
+    scannerStatus.className = 'scanner-status status-scanning';
+    scannerStatus.textContent = 'Error: Unable to access camera';
+});
+
+// Decode pipeline: frames go to a Web Worker one at a time. Most frames are a
+// downscaled centre square (where guests hold the pass); every few misses the
+// whole frame is tried at a larger downscale. The capture interval follows the
+// measured decode time, so slow phones scan less often instead of dropping frames.
+const ROI_FRACTION = 0.6;      // share of the shorter video side covered by the centre square
+const ROI_SIZE = 400;          // centre square is scaled down to at most this many pixels
+const FULL_FRAME_SIZE = 800;   // longest side of a full-frame attempt
+const FULL_FRAME_EVERY = 4;    // after this many centre misses, try the full frame once
+const MIN_INTERVAL = 33;       // ms between captures: at most ~30 decodes/s
+const MAX_INTERVAL = 250;
+const DUTY_CYCLE = 0.5;        // keep the worker busy at most half the time
+const DEDUPE_MS = 2000;        // a payload still in view is not re-sent until it leaves for this long
+
+const useBitmaps = typeof createImageBitmap === 'function' && typeof OffscreenCanvas === 'function';
+const frameCanvas = document.createElement('canvas');
+const frameContext = frameCanvas.getContext('2d', { willReadFrequently: true });
+const recentPayloads = new Map();
+const decodeStats = { samples: [], frames: 0, hits: 0, fullFrames: 0, windowStart: performance.now(), fps: 0 };
+
+let decoder = null;
+let frameId = 0;
+let centreMisses = 0;
+let averageDecodeMs = 0;
+let spareBuffer = null;
+
+function startDecoder() {
+    decoder = new Worker(scannerContainer.dataset.decoder);
+    decoder.onmessage = (event) => {
+        if (event.data.type === 'ready') {
+            scheduleCapture(0);
+        } else {
+            handleDecoded(event.data);
+        }
+    };
+    decoder.onerror = (event) => {
+        console.error('Decoder error:', event.message);
+        scannerStatus.className = 'scanner-status status-scanning';
+        scannerStatus.textContent = 'Error: QR decoder failed to load';
+    };
+    decoder.postMessage({ type: 'init', jsqr: new URL(scannerContainer.dataset.jsqr, location.href).href });
+}
+
+function scheduleCapture(delay) {
+    setTimeout(() => captureFrame().catch(error => {
+        console.warn('Frame capture failed:', error);
+        scheduleCapture(MAX_INTERVAL);
+    }), delay);
+}
+
+function frameRegion() {
+    const width = video.videoWidth, height = video.videoHeight;
+    if (centreMisses >= FULL_FRAME_EVERY) {
+        const scale = Math.min(1, FULL_FRAME_SIZE / Math.max(width, height));
+        return { name: 'full', sx: 0, sy: 0, sw: width, sh: height,
+                 width: Math.round(width * scale), height: Math.round(height * scale) };
+    }
+    const side = Math.round(Math.min(width, height) * ROI_FRACTION);
+    const size = Math.min(side, ROI_SIZE);
+    return { name: 'centre', sx: Math.round((width - side) / 2), sy: Math.round((height - side) / 2),
+             sw: side, sh: side, width: size, height: size };
+}
+
+async function captureFrame() {
+    if (video.readyState !== video.HAVE_ENOUGH_DATA || isScanning) {
+        // Nothing to decode (camera warming up, or a result is on screen)
+        scheduleCapture(MAX_INTERVAL);
+        return;
+    }
+    const region = frameRegion();
+    const message = { type: 'frame', id: ++frameId, region: region.name, width: region.width, height: region.height };
+    message.sentAt = performance.now();
+
+    if (useBitmaps) {
+        // Cropped and scaled by the browser; the worker does getImageData on an OffscreenCanvas
+        message.bitmap = await createImageBitmap(video, region.sx, region.sy, region.sw, region.sh,
+            { resizeWidth: region.width, resizeHeight: region.height, resizeQuality: 'low' });
+        decoder.postMessage(message, [message.bitmap]);
+        return;
+    }
+
+    if (frameCanvas.width !== region.width || frameCanvas.height !== region.height) {
+        frameCanvas.width = region.width;
+        frameCanvas.height = region.height;
+    }
+    frameContext.drawImage(video, region.sx, region.sy, region.sw, region.sh, 0, 0, region.width, region.height);
+    const pixels = frameContext.getImageData(0, 0, region.width, region.height).data;
+    // Reuse the buffer the worker handed back when it is the right size
+    if (spareBuffer && spareBuffer.byteLength === pixels.byteLength) {
+        new Uint8ClampedArray(spareBuffer).set(pixels);
+        message.buffer = spareBuffer;
+    } else {
+        message.buffer = pixels.buffer;
+    }
+    spareBuffer = null;
+    decoder.postMessage(message, [message.buffer]);
+}
+
+function handleDecoded(result) {
+    if (result.buffer) {
+        spareBuffer = result.buffer;
+    }
+    recordDecode(result);
+
+    averageDecodeMs = averageDecodeMs ? averageDecodeMs * 0.8 + result.ms * 0.2 : result.ms;
+    const interval = Math.min(MAX_INTERVAL, Math.max(MIN_INTERVAL, averageDecodeMs / DUTY_CYCLE));
+    scheduleCapture(Math.max(0, interval - result.ms));
+
+    if (result.region === 'full' || result.data) {
+        centreMisses = 0;
+    } else {
+        centreMisses++;
+    }
+    if (result.data && !isScanning && isNewPayload(result.data)) {
+        processQRCode(result.data);
+    }
+}
+
+function isNewPayload(payload) {
+    // Each sighting refreshes the window, so a pass held in front of the camera is sent once
+    const now = Date.now();
+    const lastSeen = recentPayloads.get(payload);
+    recentPayloads.delete(payload);
+    recentPayloads.set(payload, now);
+    if (recentPayloads.size > 50) {
+        recentPayloads.delete(recentPayloads.keys().next().value);
+    }
+    return lastSeen === undefined || now - lastSeen > DEDUPE_MS;
+}
+
+// Benchmark overlay (toggle below the video, or open /scanner?bench=1)
+const benchToggle = document.getElementById('bench-toggle');
+const benchOverlay = document.getElementById('bench-overlay');
+
+benchToggle.checked = new URLSearchParams(location.search).has('bench') || localStorage.getItem('epass_bench') === '1';
+benchOverlay.hidden = !benchToggle.checked;
+benchToggle.addEventListener('change', () => {
+    localStorage.setItem('epass_bench', benchToggle.checked ? '1' : '0');
+    benchOverlay.hidden = !benchToggle.checked;
+});
+
+function recordDecode(result) {
+    decodeStats.samples.push(result.ms);
+    if (decodeStats.samples.length > 100) decodeStats.samples.shift();
+    decodeStats.frames++;
+    if (result.data) decodeStats.hits++;
+    if (result.region === 'full') decodeStats.fullFrames++;
+
+    const now = performance.now();
+    if (now - decodeStats.windowStart >= 1000) {
+        decodeStats.fps = decodeStats.frames * 1000 / (now - decodeStats.windowStart);
+        decodeStats.frames = 0;
+        decodeStats.windowStart = now;
+    }
+    if (benchOverlay.hidden) return;
+
+    const sorted = decodeStats.samples.slice().sort((a, b) => a - b);
+    const p95 = sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * 0.95))];
+    const roundTrip = now - result.sentAt;
+    benchOverlay.textContent = [
+        `decode ${result.ms.toFixed(1)} ms · avg ${averageDecodeMs.toFixed(1)} · p95 ${p95.toFixed(1)}`,
+        `round trip ${roundTrip.toFixed(1)} ms · ${decodeStats.fps.toFixed(1)} fps`,
+        `${result.region} ${result.width}×${result.height} · ${useBitmaps ? 'ImageBitmap' : 'ImageData'}`,
+        `reads ${decodeStats.hits} · full-frame tries ${decodeStats.fullFrames}`
+    ].join('\n');
+}
+
+// Offline mode: a local pass snapshot verifies scans, queued scans sync later
+const offlineToggle = document.getElementById('offline-toggle');
+const offlineStatus = document.getElementById('offline-status');
+// v2: tags are signature hashes; older snapshots hold signature prefixes and are refetched
+const SNAPSHOT_KEY = 'epass_snapshot_v2';
+localStorage.removeItem('epass_snapshot');
+const QUEUE_KEY = 'epass_scan_queue';
+const SYNC_BATCH = 500;
+
+// Per-device ID so the server rate-limits and de-duplicates each scanner separately
+let scannerId = localStorage.getItem('epass_scanner_id');
+if (!scannerId) {
+    scannerId = window.crypto && crypto.randomUUID ? crypto.randomUUID() : String(Math.random()).slice(2);
+    localStorage.setItem('epass_scanner_id', scannerId);
+}
+
+let snapshot = loadJSON(SNAPSHOT_KEY, { version: 0, passes: {} });
+let scanQueue = loadJSON(QUEUE_KEY, []);
+let syncing = false;
+let syncConflicts = 0;
+
+offlineToggle.checked = localStorage.getItem('epass_offline') === '1';
+offlineToggle.addEventListener('change', () => {
+    localStorage.setItem('epass_offline', offlineToggle.checked ? '1' : '0');
+    updateOfflineStatus();
+});
+
+function loadJSON(key, fallback) {
+    try {
+        return JSON.parse(localStorage.getItem(key)) || fallback;
+    } catch (e) {
+        return fallback;
+    }
+}
+
+function saveSnapshot() {
+    localStorage.setItem(SNAPSHOT_KEY, JSON.stringify(snapshot));
+}
+
+function saveQueue() {
+    localStorage.setItem(QUEUE_KEY, JSON.stringify(scanQueue));
+}
+
+function updateOfflineStatus() {
+    const count = Object.keys(snapshot.passes).length;
+    let text = `Snapshot v${snapshot.version} · ${count} passes · ${scanQueue.length} scans waiting to sync`;
+    if (syncConflicts) {
+        text += ` · ${syncConflicts} conflicts (scanned elsewhere first)`;
+    }
+    offlineStatus.textContent = text;
+}
+
+async function refreshSnapshot() {
+    const query = snapshot.version ? `?since=${snapshot.version}` : '';
+    const response = await fetch('/api/scan/snapshot' + query);
+    if (!response.ok) return;
+    const data = await response.json();
+
+    if (data.full) {
+        const previous = snapshot.passes;
+        snapshot.passes = {};
+        // Keep local scans that have not reached the server yet
+        scanQueue.forEach(event => {
+            if (previous[event.pass_id]) snapshot.passes[event.pass_id] = previous[event.pass_id];
+        });
+    }
+    data.passes.forEach(([id, tag, name1, passType, timing, scannedAt, scannedBy]) => {
+        const local = snapshot.passes[id];
+        snapshot.passes[id] = {
+            tag: tag,
+            name1: name1,
+            pass_type: passType,
+            timing: timing,
+            scanned_at: scannedAt || (local && local.scanned_at) || null,
+            scanned_by: scannedBy || (local && local.scanned_by) || null
+        };
+    });
+    data.removed.forEach(id => delete snapshot.passes[id]);
+    snapshot.version = data.version;
+    saveSnapshot();
+    updateOfflineStatus();
+}
+
+async function syncQueue() {
+    if (syncing || !scanQueue.length) return;
+    syncing = true;
+    const batch = scanQueue.slice(0, SYNC_BATCH);
+    try {
+        const response = await fetch('/api/scan/sync', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ events: batch })
+        });
+        if (response.ok) {
+            const data = await response.json();
+            data.results.forEach(result => {
+                if (result.status === 'already_scanned') syncConflicts++;
+            });
+            scanQueue = scanQueue.slice(batch.length);
+            saveQueue();
+        }
+    } catch (error) {
+        console.warn('Sync failed, will retry:', error);
+    } finally {
+        syncing = false;
+        updateOfflineStatus();
+    }
+}
+
+const BASE32 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567';
+
+function decodeCompactPayload(payload) {
+    // EP1:<base32 of 16-byte pass UUID + truncated HMAC>
+    let bits = 0, value = 0;
+    const bytes = [];
+    for (const char of payload.slice(4)) {
+        const index = BASE32.indexOf(char);
+        if (index < 0) return null;
+        value = (value << 5) | index;
+        bits += 5;
+        if (bits >= 8) {
+            bits -= 8;
+            bytes.push((value >> bits) & 0xff);
+        }
+    }
+    if (bytes.length <= 16) return null;
+    const hex = bytes.map(b => b.toString(16).padStart(2, '0')).join('');
+    const id = [hex.slice(0, 8), hex.slice(8, 12), hex.slice(12, 16), hex.slice(16, 20), hex.slice(20, 32)].join('-');
+    return { id: id, sig: hex.slice(32) };
+}
+
+function decodePayload(payload) {
+    if (payload.startsWith('EP1:')) {
+        return decodeCompactPayload(payload);
+    }
+    try {
+        const decoded = JSON.parse(atob(payload));
+        return decoded && typeof decoded.id === 'string' && typeof decoded.sig === 'string' ? decoded : null;
+    } catch (e) {
+        return null;
+    }
+}
+
+function markScannedLocally(payload, scannedAt, scannedBy) {
+    const decoded = decodePayload(payload);
+    const entry = decoded && snapshot.passes[decoded.id];
+    if (entry && !entry.scanned_at) {
+        entry.scanned_at = scannedAt;
+        entry.scanned_by = scannedBy;
+        saveSnapshot();
+    }
+}
+
+// Bytes of the HMAC both payload formats carry (the compact format's truncated signature)
+const SIG_HEX_LENGTH = 18;
+
+async function signatureTag(sig) {
+    // SHA-256 of the signature bytes, truncated like the server's qr_tag()
+    const hex = sig.slice(0, SIG_HEX_LENGTH);
+    if (!/^[0-9a-f]{18}$/.test(hex)) return null;
+    const bytes = new Uint8Array(hex.match(/../g).map(pair => parseInt(pair, 16)));
+    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', bytes));
+    return Array.from(digest, b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function verifyLocally(payload) {
+    const decoded = decodePayload(payload);
+    const entry = decoded && snapshot.passes[decoded.id];
+
+    // The tag is a hash of this pass's signature: it checks a payload without revealing the signature
+    const tag = entry && await signatureTag(decoded.sig);
+    if (!entry || !tag || tag.slice(0, entry.tag.length) !== entry.tag) {
+        return { status: 'error', message: entry || !decoded ? 'Invalid or tampered QR code' : 'Pass not found in offline snapshot' };
+    }
+
+    const info = { name1: entry.name1, pass_type: entry.pass_type, timing: entry.timing };
+    if (entry.scanned_at) {
+        return {
+            status: 'already_scanned',
+            message: 'This pass has already been used',
+            scanned_at: entry.scanned_at,
+            scanned_by: entry.scanned_by,
+            pass_info: info
+        };
+    }
+
+    const now = new Date();
+    entry.scanned_at = now.toISOString();
+    entry.scanned_by = SCANNER_USER;
+    saveSnapshot();
+    scanQueue.push({ payload: payload, pass_id: decoded.id, scanned_at: now.getTime() });
+    saveQueue();
+    updateOfflineStatus();
+
+    return { status: 'success', message: 'Pass accepted offline (will sync)', pass_info: info };
+}
+
+// The server answered, but not with a scan result: never verified offline instead
+class ScanServerError extends Error {}
+
+async function scanOnline(payload) {
+    // fetch() only rejects (with a TypeError) when the server could not be reached
+    const response = await fetch('/api/scan', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-Scanner-Id': scannerId
+        },
+        body: JSON.stringify({ payload: payload })
+    });
+
+    if (response.status === 401 || response.redirected) {
+        // Session expired: login_required redirected us to the login page
+        window.location.href = scannerContainer.dataset.loginUrl;
+        throw new ScanServerError('Session expired. Please log in again.');
+    }
+    const isJSON = (response.headers.get('Content-Type') || '').includes('application/json');
+    if (response.status >= 500 || !isJSON) {
+        throw new ScanServerError(`Server error (${response.status}). Please try again.`);
+    }
+
+    const data = await response.json();
+    if (data.status === 'success') {
+        markScannedLocally(payload, new Date().toISOString(), SCANNER_USER);
+    }
+    return data;
+}
+
+async function processQRCode(payload) {
+    if (isScanning) return;
+
+    isScanning = true;
+    scannerStatus.className = 'scanner-status status-scanning';
+    scannerStatus.textContent = 'Processing...';
+
+    try {
+        let data;
+        if (offlineToggle.checked) {
+            data = await verifyLocally(payload);
+        } else {
+            try {
+                data = await scanOnline(payload);
+            } catch (error) {
+                if (!(error instanceof TypeError)) throw error;
+                console.warn('Network error, verifying offline:', error);
+                data = await verifyLocally(payload);
+            }
+        }
+
+        if (data.status === 'rate_limited') {
+            // Not the guest's fault: no error popup, the code is retried on its next read
+            recentPayloads.delete(payload);
+            isScanning = false;
+        } else if (data.status === 'success') {
+            showSuccessModal(data);
+            successScans++;
+            successCount.textContent = successScans;
+        } else {
+            showErrorModal(data);
+            errorScans++;
+            errorCount.textContent = errorScans;
+        }
+    } catch (error) {
+        console.error('Scan error:', error);
+        showErrorModal({
+            status: 'not_verified',
+            message: error instanceof ScanServerError ? error.message : 'Network error. Please try again.'
+        });
+        errorScans++;
+        errorCount.textContent = errorScans;
+    } finally {
+        scannerStatus.className = 'scanner-status status-ready';
+        scannerStatus.textContent = 'Ready to scan QR codes';
+    }
+}
+
+function backgroundSync() {
+    syncQueue().then(() => refreshSnapshot()).catch(error => console.warn('Snapshot refresh failed:', error));
+}
+
+updateOfflineStatus();
+backgroundSync();
+setInterval(backgroundSync, 15000);
+window.addEventListener('online', backgroundSync);
+
+function showSuccessModal(data) {
+    modalContent.className = 'modal-content modal-success';
+    modalIcon.textContent = '✅';
+    modalTitle.textContent = 'Entry Approved!';
+    modalMessage.textContent = data.message;
+
+    const info = data.pass_info;
+    let passInfoHTML = `
+        <div class="pass-info-row">
+            <span class="pass-info-label">Name:</span>
+            <span class="pass-info-value">${info.name1}</span>
+        </div>
+    `;
+
+    if (info.phone1) {
+        passInfoHTML += `
+            <div class="pass-info-row">
+                <span class="pass-info-label">Phone:</span>
+                <span class="pass-info-value">${info.phone1}</span>
+            </div>
+        `;
+    }
+
+    if (info.name2 && info.phone2) {
+        passInfoHTML += `
+            <div class="pass-info-row">
+                <span class="pass-info-label">Partner:</span>
+                <span class="pass-info-value">${info.name2}</span>
+            </div>
+            <div class="pass-info-row">
+                <span class="pass-info-label">Partner Phone:</span>
+                <span class="pass-info-value">${info.phone2}</span>
+            </div>
+        `;
+    }
+
+    passInfoHTML += `
+        <div class="pass-info-row">
+            <span class="pass-info-label">Pass Type:</span>
+            <span class="pass-info-value">${info.pass_type}</span>
+        </div>
+        <div class="pass-info-row">
+            <span class="pass-info-label">Timing:</span>
+            <span class="pass-info-value">${info.timing}</span>
+        </div>
+    `;
+
+    passInfo.innerHTML = passInfoHTML;
+    passInfo.style.display = 'block';
+    modal.style.display = 'block';
+}
+
+function showErrorModal(data) {
+    modalContent.className = 'modal-content modal-error';
+    modalIcon.textContent = '❌';
+
+    if (data.status === 'already_scanned') {
+        modalContent.className = 'modal-content modal-warning';
+        modalIcon.textContent = '⚠️';
+        modalTitle.textContent = 'Already Used!';
+        modalMessage.textContent = data.message;
+
+        if (data.pass_info) {
+            const info = data.pass_info;
+            let passInfoHTML = `
+                <div class="pass-info-row">
+                    <span class="pass-info-label">Name:</span>
+                    <span class="pass-info-value">${info.name1}</span>
+                </div>
+                <div class="pass-info-row" style="${info.phone1 ? '' : 'display: none;'}">
+                    <span class="pass-info-label">Phone:</span>
+                    <span class="pass-info-value">${info.phone1}</span>
+                </div>
+                <div class="pass-info-row">
+                    <span class="pass-info-label">Scanned At:</span>
+                    <span class="pass-info-value">${data.scanned_at}</span>
+                </div>
+                <div class="pass-info-row">
+                    <span class="pass-info-label">Scanned By:</span>
+                    <span class="pass-info-value">${data.scanned_by}</span>
+                </div>
+            `;
+            passInfo.innerHTML = passInfoHTML;
+            passInfo.style.display = 'block';
+        } else {
+            passInfo.style.display = 'none';
+        }
+    } else if (data.status === 'not_verified') {
+        // No answer about the pass itself (server error, expired session): not admitted
+        modalTitle.textContent = 'Not Verified';
+        modalMessage.textContent = data.message;
+        passInfo.style.display = 'none';
+    } else {
+        modalTitle.textContent = 'Invalid Pass!';
+        modalMessage.textContent = data.message || 'This QR code is invalid or has been tampered with.';
+        passInfo.style.display = 'none';
+    }
+
+    modal.style.display = 'block';
+}
+
+function closeModal() {
+    modal.style.display = 'none';
+    isScanning = false;
+}
+
+// Close modal when clicking outside
+window.onclick = function(event) {
+    if (event.target == modal) {
+        closeModal();
+    }
+}
+
+// Precache the scanner shell so a reload at the gate needs no network
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register(scannerContainer.dataset.serviceWorker).catch(() => {});
+}
@@ -0,0 +1,69 @@
+// Scanner service worker: precaches the scanner shell so a reload at the gate
+// only needs the network for /api/* calls. Rendered by the service_worker route.
+const CACHE_NAME = 'epass-scanner-{{ version }}';
+const SCANNER_URL = {{ scanner_url|tojson }};
+const SHELL_ASSETS = {{ shell_assets|tojson }};
+
+self.addEventListener('install', (event) => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(CACHE_NAME);
+        await Promise.all(SHELL_ASSETS.map(async (url) => {
+            if (url.startsWith('/')) {
+                await cache.add(url);
+            } else {
+                // CDN fallback while a vendor file is not downloaded yet: cached opaquely
+                await cache.put(url, await fetch(url, { mode: 'no-cors' }));
+            }
+        }));
+        // Only cache the page itself when logged in (not a redirect to /login)
+        const page = await fetch(SCANNER_URL, { credentials: 'same-origin' });
+        if (page.ok && !page.redirected) {
+            await cache.put(SCANNER_URL, page);
+        }
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter((name) => name.startsWith('epass-scanner-') && name !== CACHE_NAME)
+            .map((name) => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (request.mode === 'navigate' && url.origin === location.origin && url.pathname === SCANNER_URL) {
+        // Cached page first, refreshed in the background for the next reload
+        event.respondWith((async () => {
+            const cache = await caches.open(CACHE_NAME);
+            const cached = await cache.match(SCANNER_URL);
+            const refresh = fetch(request).then((response) => {
+                if (response.ok && !response.redirected) {
+                    cache.put(SCANNER_URL, response.clone());
+                }
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(refresh.catch(() => {}));
+                return cached;
+            }
+            return refresh;
+        })());
+        return;
+    }
+
+    if (SHELL_ASSETS.includes(url.origin === location.origin ? url.pathname : request.url)) {
+        // Fingerprinted, so a cached copy is never stale
+        event.respondWith(caches.match(request).then((cached) => cached || fetch(request)));
+    }
+    // Everything else, including /api/*, goes straight to the network
+});